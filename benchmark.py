@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import time
+
+import numpy as np
+
+from generator import generate_instance, write_instance
+from engines import ENGINES, TabooEngine
+from heuristic import Solver
+from telemetry import Telemetry
+from main import load_instance
+
+DEFAULT_SIZES = '50x30,200x60,1000x150,5000x500'
+
+
+def measure(function, repeats):
+    """Calls function `repeats` times and returns timing statistics in seconds per call."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        # solver may report progress on standard output
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        times.append(time.perf_counter() - start)
+    return {'calls': repeats, 'best': min(times), 'mean': statistics.mean(times)}
+
+
+def benchmark_instance(file_path, seed, repeats, neighbourhood_length, iterations, target_fitness, max_iterations):
+    instance = load_instance(file_path)
+    solver = Solver(*instance, seed=seed)
+    initial = solver.initial_solution
+    neighbours = list(solver.generate_neighbourhood(initial, neighbourhood_length))
+
+    benchmarks = {
+        'load_instance': measure(lambda: load_instance(file_path), repeats),
+        'generate_initial_solution': measure(solver.generate_initial_solution, repeats),
+        'is_valid': measure(lambda: solver.is_valid(initial), repeats),
+        'global_goal_first': measure(lambda: solver.global_goal_first(initial), repeats),
+        'global_goal_second': measure(lambda: solver.global_goal_second(initial), repeats),
+        'generate_neighbourhood': measure(lambda: solver.generate_neighbourhood(initial, neighbourhood_length),
+                                          repeats),
+        'score_neighbourhood': measure(lambda: list(solver.score_neighbourhood(initial, neighbourhood_length)),
+                                       repeats),
+        # fitness of materialized neighbour solutions, one by one and at once
+        'fitness_func_neighbours': measure(lambda: [solver.fitness_func(s) for s in neighbours], repeats),
+        'batch_fitness_neighbours': measure(lambda: solver.batch_fitness(neighbours), repeats),
+    }
+    taboo_run = measure(lambda: solver.taboo_search(50, iterations, neighbourhood_length, iterations), repeats)
+    benchmarks['taboo_iteration'] = {'calls': repeats * iterations,
+                                     'best': taboo_run['best'] / iterations,
+                                     'mean': taboo_run['mean'] / iterations}
+
+    # end to end, from fresh solver to first solution with target fitness, for every engine
+    # single move engines get as many move evaluations as taboo search evaluates in max_iterations
+    time_to_target = {}
+    for name, engine_class in ENGINES.items():
+        if engine_class is TabooEngine:
+            engine = TabooEngine(50, neighbourhood_length, 50)
+            engine_iterations = max_iterations
+        else:
+            engine = engine_class()
+            engine_iterations = max_iterations * neighbourhood_length
+        # telemetry shows where time of the run goes: generation, validation, scoring or applying moves
+        telemetry = Telemetry()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            target_solver = Solver(*instance, seed=seed, telemetry=telemetry)
+            solution = engine.run(target_solver, engine_iterations, target_fitness=target_fitness)
+        elapsed = time.perf_counter() - start
+        fitness = target_solver.fitness_func(solution)
+        time_to_target[name] = {
+            'target_fitness': target_fitness,
+            'reached': fitness >= target_fitness,
+            'fitness': fitness,
+            'seconds': elapsed,
+            'telemetry': telemetry.summary(),
+        }
+
+    return {
+        'path': file_path,
+        'vehicles': solver.vehicle_count,
+        'tracks': solver.track_count,
+        'initial_fitness': solver.fitness_func(initial),
+        'initial_unscheduled_vehicles': len(initial.unscheduled_vehicles),
+        'benchmarks': benchmarks,
+        'time_to_target': time_to_target,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark solver hot paths on generated instances of growing size.')
+    parser.add_argument('instances', metavar='instance_file', nargs='*',
+                        help='Additional instance files to benchmark, e.g. data/instanca1.txt')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='Comma separated VEHICLESxTRACKS sizes of generated instances')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of instance generator and solver')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of measured calls of each hot path')
+    parser.add_argument('--neighbourhood', type=int, default=100, help='Neighbourhood length')
+    parser.add_argument('--iterations', type=int, default=5, help='Taboo iterations per measured taboo run')
+    parser.add_argument('--target-fitness', type=float, default=0.5,
+                        help='Fitness that end to end run has to reach')
+    parser.add_argument('--max-iterations', type=int, default=300,
+                        help='Iteration limit of end to end taboo run, other engines evaluate as many moves')
+    parser.add_argument('--instance-dir', default='benchmark_instances',
+                        help='Folder where generated instances are written')
+    parser.add_argument('--output', default='benchmark.json', help='Path of JSON result file')
+    args = parser.parse_args()
+
+    paths = list(args.instances)
+    for size in args.sizes.split(','):
+        if not size:
+            continue
+        vehicles, tracks = (int(x) for x in size.lower().split('x'))
+        path = os.path.join(args.instance_dir, 'generated-v{}-t{}-s{}.txt'.format(vehicles, tracks, args.seed))
+        if not os.path.isfile(path):
+            write_instance(path, generate_instance(vehicles, tracks, seed=args.seed))
+        paths.append(path)
+
+    results = []
+    for path in paths:
+        result = benchmark_instance(path, args.seed, args.repeats, args.neighbourhood, args.iterations,
+                                    args.target_fitness, args.max_iterations)
+        results.append(result)
+        print('{}: {} vehicles, {} tracks'.format(path, result['vehicles'], result['tracks']))
+        for name, timing in result['benchmarks'].items():
+            print('    {:<32}{:>12.6f} s'.format(name, timing['best']))
+        for name, run in result['time_to_target'].items():
+            print('    {:<32}{:>12.6f} s (reached: {})'.format('time_to_target ' + name, run['seconds'], run['reached']))
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'parameters': {name: value for name, value in vars(args).items() if name != 'instances'},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from engines import ENGINES, TabooEngine
+from heuristic import Solver, remove_vehicles
+from main import load_instance, parse_duration, read_result
+
+DEFAULT_SOCKET = '/tmp/garage-solver.sock'
+
+
+def instance_path(filename):
+    """Returns absolute path of instance file given by path or by name of file stored in data/ folder."""
+    file_path = filename
+    if not os.path.isfile(file_path):
+        file_path = os.path.join('data', filename)
+    if not os.path.isfile(file_path):
+        raise ValueError('Instance file {} does not exist!'.format(filename))
+    return os.path.abspath(file_path)
+
+
+def apply_changes(instance_data, changes):
+    """Returns copy of instance tuple (as returned by main.load_instance) with changes applied.
+
+    `changes` may hold `departure_times` (vehicle number -> new departure time), `closed_tracks`
+    (no vehicle may park on them) and `removed_vehicles` (remaining vehicles are renumbered).
+    Vehicles and tracks are numbered from 1, as in result files, and always refer to the instance file."""
+    (vehicle_count, track_count, vehicle_lengths, vehicle_series, vehicle_restrictions,
+     track_lengths, departure_times, schedule_type, blocking_tracks) = instance_data
+    departure_times = np.array(departure_times)
+    for vehicle, departure_time in changes.get('departure_times', {}).items():
+        departure_times[int(vehicle) - 1] = departure_time
+    vehicle_restrictions = np.array(vehicle_restrictions)
+    for track in changes.get('closed_tracks', []):
+        vehicle_restrictions[:, int(track) - 1] = False
+
+    removed = sorted(set(int(v) - 1 for v in changes.get('removed_vehicles', [])))
+    if removed:
+        vehicle_count -= len(removed)
+        vehicle_lengths, vehicle_series, departure_times, schedule_type = (
+            np.delete(np.asarray(values), removed)
+            for values in (vehicle_lengths, vehicle_series, departure_times, schedule_type))
+        vehicle_restrictions = np.delete(vehicle_restrictions, removed, axis=0)
+    return (vehicle_count, track_count, vehicle_lengths, vehicle_series, vehicle_restrictions,
+            track_lengths, departure_times, schedule_type, blocking_tracks)
+
+
+def changed_solver(instance, changes, seed=None):
+    """Returns solver of cached instance with changes (as in apply_changes) applied, without initial solution.
+
+    Without changes solver is a clone of the cached one. Departure time and closed track changes reuse
+    cached index and compute again only parts they affect, only removed vehicles need a new solver."""
+    template = instance.solver
+    if changes.get('removed_vehicles'):
+        return Solver(*apply_changes(instance.data, changes), backend=template.backend,
+                      build_initial_solution=False, seed=seed)
+    departure_times = None
+    if changes.get('departure_times'):
+        departure_times = list(template.departure_times)
+        for vehicle, departure_time in changes['departure_times'].items():
+            departure_times[int(vehicle) - 1] = departure_time
+    closed_tracks = [int(track) - 1 for track in changes.get('closed_tracks', [])]
+    if departure_times is None and not closed_tracks:
+        solver = template.clone(seed)
+        solver.initial_solution = None
+        return solver
+    return template.changed(departure_times, closed_tracks, seed)
+
+
+class CachedInstance:
+    """Parsed instance with solver built on it, kept while instance file does not change.
+
+    `solver` is a template, its precomputed index and initial solution are shared by clones
+    that run jobs. `best_schedule` is the best schedule found by solve jobs, resolve jobs start from it."""
+    def __init__(self, file_path, backend):
+        self.file_path = file_path
+        self.stat_key = CachedInstance.stat_key(file_path)
+        self.data = load_instance(file_path)
+        self.solver = Solver(*self.data, backend=backend)
+        self.best_schedule = None
+        self.best_fitness = None
+
+    @staticmethod
+    def stat_key(file_path):
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+
+class InstanceCache:
+    """Least recently used instances, at most `size` of them.
+
+    Instances are kept as futures, the thread that first needs an instance loads it without holding
+    the cache lock and other threads that need it wait only for its future."""
+    def __init__(self, size, backend):
+        self.size = size
+        self.backend = backend
+        self.instances = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, file_path):
+        stat_key = CachedInstance.stat_key(file_path)
+        with self.lock:
+            future = self.instances.get(file_path)
+            stale = (future is not None and future.done() and
+                     (future.exception() is not None or future.result().stat_key != stat_key))
+            loading = future is None or stale
+            if loading:
+                future = Future()
+                self.instances[file_path] = future
+            self.instances.move_to_end(file_path)
+        if loading:
+            try:
+                future.set_result(CachedInstance(file_path, self.backend))
+            except Exception as e:
+                future.set_exception(e)
+            with self.lock:
+                if future.exception() is not None and self.instances.get(file_path) is future:
+                    del self.instances[file_path]
+                while len(self.instances) > self.size:
+                    self.instances.popitem(last=False)
+        return future.result()
+
+    def status(self):
+        with self.lock:
+            futures = list(self.instances.values())
+        return [{'instance': instance.file_path, 'vehicles': instance.solver.vehicle_count,
+                 'tracks': instance.solver.track_count, 'best_fitness': instance.best_fitness}
+                for instance in (future.result() for future in futures
+                                 if future.done() and future.exception() is None)]
+
+
+class Job:
+    """Search of one solve or resolve request, runs in its own thread.
+
+    Events (accepted, improvement, done) are appended to `events` and watchers are woken up
+    through `condition`. Improvements are published at most once per `stream_interval` seconds,
+    the best solution is always in the final done event."""
+    def __init__(self, job_id, kind, request):
+        self.id = job_id
+        self.kind = kind
+        self.request = request
+        self.state = 'queued'
+        self.cancel = threading.Event()
+        self.condition = threading.Condition()
+        self.events = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.solver = None
+        self.initial_fitness = None
+        # (iteration, fitness, solution) of the best solution so far, replaced as a whole
+        self.best = None
+        self.improvements = 0
+        self.error = None
+        self.stream_interval = float(request.get('stream_interval', 0.1))
+        self.published = 0.0
+
+    @property
+    def done(self):
+        return self.state in ('done', 'cancelled', 'failed')
+
+    def publish(self, event, **values):
+        values['event'] = event
+        values['job'] = self.id
+        with self.condition:
+            self.events.append(values)
+            self.condition.notify_all()
+
+    def watch(self):
+        """Yields events of job from the first one until the done event."""
+        position = 0
+        while True:
+            with self.condition:
+                while position == len(self.events):
+                    self.condition.wait()
+                events = self.events[position:]
+            position += len(events)
+            for event in events:
+                yield event
+                if event['event'] == 'done':
+                    return
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def improved(self, iteration, solution):
+        # engines keep goal components of improved solutions, so their fitness is cheap
+        fitness = float(self.solver.fitness_from_components(self.solver.goal_components(solution)))
+        self.best = (iteration, fitness, solution)
+        self.improvements += 1
+        now = time.monotonic()
+        if now - self.published >= self.stream_interval:
+            self.published = now
+            self.publish('improvement', **self.solution_values(self.request.get('solutions', True)))
+
+    def solution_values(self, with_solution=True):
+        best = self.best
+        if best is None:
+            return {'iteration': 0, 'fitness': None, 'elapsed': self.elapsed()}
+        iteration, fitness, solution = best
+        values = {'iteration': iteration, 'fitness': fitness, 'elapsed': self.elapsed(),
+                  'unscheduled': len(solution.unscheduled_vehicles)}
+        if with_solution:
+            values['solution'] = str(solution)
+        return values
+
+    def status(self):
+        iteration, fitness, _ = self.best if self.best is not None else (0, None, None)
+        return {'job': self.id, 'kind': self.kind, 'instance': self.request.get('instance'), 'state': self.state,
+                'initial_fitness': self.initial_fitness, 'fitness': fitness, 'iteration': iteration,
+                'improvements': self.improvements, 'elapsed': self.elapsed(), 'error': self.error}
+
+
+class SolverDaemon:
+    """Resident solver that keeps parsed instances and their solvers in memory between requests.
+
+    Jobs run in threads of one process, at most `max_jobs` of them search at the same time,
+    others wait in queued state. Finished jobs are kept for status requests, at most `keep_jobs` of them."""
+    def __init__(self, backend='list', cache_size=16, max_jobs=1, keep_jobs=100):
+        self.cache = InstanceCache(cache_size, backend)
+        self.running = threading.Semaphore(max_jobs)
+        self.keep_jobs = keep_jobs
+        self.jobs = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.server = None
+
+    def handle(self, request):
+        """Handles one request and yields its responses."""
+        command = request.get('command')
+        if command in ('solve', 'resolve'):
+            job = self.submit(command, request)
+            yield {'event': 'accepted', 'job': job.id}
+            if request.get('stream'):
+                yield from (event for event in job.watch() if event['event'] != 'accepted')
+        elif command == 'watch':
+            yield from self.job(request).watch()
+        elif command == 'status':
+            if 'job' in request:
+                yield dict(self.job(request).status(), event='status')
+            else:
+                with self.lock:
+                    jobs = [job.status() for job in self.jobs.values()]
+                yield {'event': 'status', 'jobs': jobs, 'instances': self.cache.status()}
+        elif command == 'result':
+            job = self.job(request)
+            yield dict(job.status(), event='result', **job.solution_values())
+        elif command == 'cancel':
+            job = self.job(request)
+            job.cancel.set()
+            yield {'event': 'cancelled', 'job': job.id, 'state': job.state}
+        elif command == 'shutdown':
+            with self.lock:
+                for job in self.jobs.values():
+                    job.cancel.set()
+            yield {'event': 'shutdown'}
+            if self.server is not None:
+                threading.Thread(target=self.server.shutdown).start()
+        else:
+            raise ValueError('Unknown command {}!'.format(command))
+
+    def job(self, request):
+        with self.lock:
+            job = self.jobs.get(request.get('job'))
+        if job is None:
+            raise ValueError('Unknown job {}!'.format(request.get('job')))
+        return job
+
+    def submit(self, kind, request):
+        engine_name = request.get('engine', 'taboo')
+        if engine_name not in ENGINES:
+            raise ValueError('Unknown engine {}!'.format(engine_name))
+        request = dict(request, instance=instance_path(request['instance']))
+        with self.lock:
+            job = Job(self.next_id, kind, request)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, other in self.jobs.items() if other.done]
+            for job_id in finished[:max(0, len(finished) - self.keep_jobs)]:
+                del self.jobs[job_id]
+        job.publish('accepted')
+        threading.Thread(target=self.run, args=(job,), daemon=True).start()
+        return job
+
+    def run(self, job):
+        with self.running:
+            try:
+                if job.cancel.is_set():
+                    job.state = 'cancelled'
+                else:
+                    self.search(job)
+            except Exception as e:
+                job.state = 'failed'
+                job.error = str(e)
+            job.finished = time.time()
+        values = job.solution_values()
+        if job.best is not None:
+            values['valid'] = job.solver.is_valid(job.best[2])[0]
+        job.publish('done', state=job.state, error=job.error, **values)
+
+    def search(self, job):
+        request = job.request
+        job.state = 'running'
+        job.started = time.time()
+        instance = self.cache.get(request['instance'])
+        seed = request.get('seed')
+        if job.kind == 'solve':
+            solver = instance.solver.clone(seed)
+            if request.get('beam_width', 1) > 1:
+                solver.initial_solution = solver.generate_initial_solution(beam_width=request['beam_width'])
+        else:
+            changes = request.get('changes', {})
+            solver = changed_solver(instance, changes, seed)
+            if request.get('result_file'):
+                schedule = read_result(request['result_file'])
+            elif instance.best_schedule is not None:
+                schedule = instance.best_schedule
+            else:
+                schedule = [instance.solver.initial_solution.track(t) for t in range(instance.solver.track_count)]
+            removed = [int(v) - 1 for v in changes.get('removed_vehicles', [])]
+            solver.initial_solution = solver.repair_solution(remove_vehicles(schedule, removed))
+        job.solver = solver
+        job.initial_fitness = float(solver.fitness_func(solver.initial_solution))
+        job.best = (0, job.initial_fitness, solver.initial_solution)
+
+        engine_name = request.get('engine', 'taboo')
+        if engine_name == 'taboo':
+            engine = TabooEngine(50, 100, 50, workers=request.get('workers'))
+        else:
+            engine = ENGINES[engine_name]()
+        time_limit = request.get('time_limit')
+        if time_limit is not None:
+            time_limit = parse_duration(str(time_limit))
+        if request.get('deadline') is not None:
+            remaining = max(0.0, float(request['deadline']) - time.time())
+            time_limit = remaining if time_limit is None else min(time_limit, remaining)
+        iterations = request.get('iterations')
+        if iterations is None and time_limit is None:
+            iterations = engine.default_iterations
+
+        solution = engine.run(solver, iterations, time_limit=time_limit, on_improvement=job.improved,
+                              cancel=job.cancel)
+        fitness = float(solver.fitness_func(solution))
+        job.best = (job.best[0], fitness, solution)
+        job.state = 'cancelled' if job.cancel.is_set() else 'done'
+        if job.kind == 'solve' and (instance.best_fitness is None or instance.best_fitness < fitness):
+            instance.best_schedule = [solution.track(t) for t in range(solver.track_count)]
+            instance.best_fitness = fitness
+
+    def serve(self, socket_path):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                # one JSON request per line, every response is written as one JSON line
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        for response in daemon.handle(json.loads(line)):
+                            self.wfile.write((json.dumps(response) + '\n').encode())
+                            self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    except Exception as e:
+                        self.wfile.write((json.dumps({'event': 'error', 'message': str(e)}) + '\n').encode())
+                        self.wfile.flush()
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            # connection threads (e.g. watching clients) do not keep daemon alive after shutdown
+            daemon_threads = True
+
+        with Server(socket_path, Handler) as server:
+            self.server = server
+            print('Solver daemon listening on', socket_path)
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(socket_path)
+
+
+def send_request(socket_path, request):
+    """Sends request to daemon and yields its responses, streamed requests end with done event."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + '\n').encode())
+        streamed = request.get('stream') or request.get('command') == 'watch'
+        for line in client.makefile('r'):
+            response = json.loads(line)
+            yield response
+            if not streamed or response['event'] in ('done', 'error'):
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident solver of garage schedules on Unix socket.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Path of Unix socket')
+    subparsers = parser.add_subparsers(dest='action')
+    serve_parser = subparsers.add_parser('serve', help='Run daemon')
+    serve_parser.add_argument('--backend', choices=['list', 'array'], default='list',
+                              help='Solution representation used by search')
+    serve_parser.add_argument('--cache-size', type=int, default=16, help='Number of instances kept in memory')
+    serve_parser.add_argument('--max-jobs', type=int, default=1, help='Number of jobs searching at the same time')
+    request_parser = subparsers.add_parser('request', help='Send JSON request to daemon and print responses')
+    request_parser.add_argument('request', help='Request, e.g. \'{"command": "solve", "instance": "instanca1.txt"}\'')
+    args = parser.parse_args()
+
+    if args.action == 'serve':
+        SolverDaemon(args.backend, args.cache_size, args.max_jobs).serve(args.socket)
+    elif args.action == 'request':
+        for response in send_request(args.socket, json.loads(args.request)):
+            print(json.dumps(response))
+            sys.stdout.flush()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
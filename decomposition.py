@@ -0,0 +1,212 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from engines import TabooEngine
+from heuristic import Solver
+
+
+class Cluster:
+    """Tracks and vehicles of one subproblem, numbered as in whole instance."""
+    def __init__(self, tracks, vehicles):
+        self.tracks = tracks
+        self.vehicles = vehicles
+
+    def instance(self, solver):
+        """Returns subproblem as instance tuple in the same order as main.load_instance."""
+        track_index = {t: i for i, t in enumerate(self.tracks)}
+        blocking_tracks = {}
+        for blocking_track, blocked_tracks in solver.blocking_tracks.items():
+            if blocking_track - 1 in track_index:
+                blocking_tracks[track_index[blocking_track - 1] + 1] = [track_index[t - 1] + 1 for t in blocked_tracks]
+        return (len(self.vehicles), len(self.tracks),
+                [solver.vehicle_lengths[v] for v in self.vehicles],
+                [solver.vehicle_series[v] for v in self.vehicles],
+                solver.vehicle_restrictions[np.ix_(self.vehicles, self.tracks)],
+                [solver.track_lengths[t] for t in self.tracks],
+                [solver.departure_times[v] for v in self.vehicles],
+                [solver.schedule_type[v] for v in self.vehicles],
+                blocking_tracks)
+
+    def schedule(self, solution):
+        """Returns schedule of solution of whole instance restricted to cluster, numbered as in subproblem."""
+        vehicle_index = {v: i for i, v in enumerate(self.vehicles)}
+        return [[vehicle_index[v] for v in solution.track(t)] for t in self.tracks]
+
+
+def _track_atoms(solver):
+    # groups of tracks connected by blocking relations, they always stay in one cluster
+    parent = list(range(solver.track_count))
+
+    def find(t):
+        while parent[t] != t:
+            parent[t] = parent[parent[t]]
+            t = parent[t]
+        return t
+
+    for blocking_track, blocked_tracks in solver.blocking_tracks.items():
+        for blocked_track in blocked_tracks:
+            parent[find(blocked_track - 1)] = find(blocking_track - 1)
+    return parent, find
+
+
+def find_clusters(solver, cluster_count, min_cluster_tracks=4):
+    """Splits tracks into at most `cluster_count` clusters of weakly coupled tracks.
+
+    Tracks linked by blocking relations always stay together. If blocking relations and vehicle
+    restrictions split tracks into independent groups, clusters are made of whole groups. Otherwise
+    tracks are cut into contiguous ranges of similar total length, every cut is placed where fewest
+    vehicles can park on both of its sides. Returns list of sorted track lists."""
+    cluster_count = max(1, min(cluster_count, solver.track_count // min_cluster_tracks))
+    parent, find = _track_atoms(solver)
+
+    # independent groups: vehicles connect all tracks they can park on
+    for tracks in solver.index.vehicle_tracks:
+        for t in tracks[1:]:
+            parent[find(t)] = find(tracks[0])
+    groups = {}
+    for t in range(solver.track_count):
+        groups.setdefault(find(t), []).append(t)
+    # tracks no vehicle can park on do not make independent group
+    unused_tracks = [t for t in range(solver.track_count) if solver.index.track_compatibility[t] == 0]
+    groups = [group for group in groups.values() if any(solver.index.track_compatibility[t] for t in group)]
+    if len(groups) > 1 and cluster_count > 1:
+        # largest groups first, each to the cluster with least track length so far
+        clusters = [[] for _ in range(min(cluster_count, len(groups)))]
+        lengths = [0] * len(clusters)
+        for group in sorted(groups, key=lambda group: -sum(solver.track_lengths[t] for t in group)):
+            i = lengths.index(min(lengths))
+            clusters[i].extend(group)
+            lengths[i] += sum(solver.track_lengths[t] for t in group)
+        clustered = set(t for cluster in clusters for t in cluster)
+        clusters[-1].extend(t for t in unused_tracks if t not in clustered)
+        return [sorted(cluster) for cluster in clusters]
+
+    # cut before track p is possible if no tracks on its different sides are linked by blocking
+    _, find = _track_atoms(solver)
+    atom_ranges = {}
+    for t in range(solver.track_count):
+        first, _ = atom_ranges.get(find(t), (t, t))
+        atom_ranges[find(t)] = (first, t)
+    linked = np.zeros(solver.track_count + 1, dtype=np.int64)
+    for first, last in atom_ranges.values():
+        linked[first + 1] += 1
+        linked[last + 1] -= 1
+    linked = np.cumsum(linked)
+    cuts = [p for p in range(1, solver.track_count) if linked[p] == 0]
+    # number of vehicles that can park both before and after each cut position
+    straddling = np.zeros(solver.track_count + 1, dtype=np.int64)
+    for tracks in solver.index.vehicle_tracks:
+        if tracks:
+            straddling[tracks[0] + 1] += 1
+            straddling[tracks[-1] + 1] -= 1
+    straddling = np.cumsum(straddling)
+
+    track_ends = np.cumsum(solver.track_lengths)
+    boundaries = [0]
+    for i in range(1, cluster_count):
+        target = track_ends[-1] * i / cluster_count
+        # cuts within quarter of cluster length around balanced position
+        window = track_ends[-1] / cluster_count / 4
+        candidates = [p for p in cuts if abs(track_ends[p - 1] - target) <= window and
+                      p - boundaries[-1] >= min_cluster_tracks and solver.track_count - p >= min_cluster_tracks]
+        if candidates:
+            boundaries.append(min(candidates, key=lambda p: (straddling[p], abs(track_ends[p - 1] - target))))
+    boundaries.append(solver.track_count)
+    return [list(range(start, end)) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def assign_vehicles(solver, track_clusters, solution):
+    """Returns clusters with vehicles assigned, vehicles stay in cluster of their track in solution.
+
+    Unscheduled vehicles go to the cluster with most unused capacity among clusters they can park in."""
+    cluster_of_track = {t: i for i, tracks in enumerate(track_clusters) for t in tracks}
+    vehicles = [[] for _ in track_clusters]
+    for t in range(solver.track_count):
+        vehicles[cluster_of_track[t]].extend(solution.track(t))
+    free_capacity = [sum(solution.unused_track_capacity[t] for t in tracks) for tracks in track_clusters]
+    for vehicle in solution.track(solver.track_count):
+        allowed = set(cluster_of_track[t] for t in solver.index.vehicle_tracks[vehicle])
+        if allowed:
+            i = max(allowed, key=lambda i: free_capacity[i])
+            vehicles[i].append(vehicle)
+            free_capacity[i] -= solver.vehicle_lengths[vehicle] + 0.5
+    return [Cluster(tracks, sorted(cluster_vehicles)) for tracks, cluster_vehicles in zip(track_clusters, vehicles)]
+
+
+def _solve_cluster(instance, schedule, backend, seed, engine, iterations, deadline):
+    # solves one subproblem in worker process until absolute `deadline` shared by all clusters, returns its schedule
+    time_limit = None if deadline is None else max(0.0, deadline - time.time())
+    solver = Solver(*instance, backend=backend, build_initial_solution=False, seed=seed)
+    solver.initial_solution = solver.repair_solution(schedule)
+    if solver.initial_solution.used_tracks_count < 2 or solver.vehicle_count <= solver.track_count:
+        # global goals of subproblem are not defined for one used track or for every vehicle on its own track
+        return [solver.initial_solution.track(t) for t in range(solver.track_count)]
+    if time_limit == 0:
+        # cluster waited for a worker until its share of time limit ran out
+        return [solver.initial_solution.track(t) for t in range(solver.track_count)]
+    solution = engine.run(solver, iterations, time_limit=time_limit)
+    return [solution.track(t) for t in range(solver.track_count)]
+
+
+def decomposed_search(solver, cluster_count, engine=None, iterations=None, time_limit=None, final_share=0.2,
+                      workers=None, seed=None, checkpoints=(), on_checkpoint=None):
+    """Solves clusters of weakly coupled tracks concurrently, merges them and finishes with short global search.
+
+    Clusters start from solver's initial solution restricted to them. Merged solution is repaired,
+    which also inserts vehicles left unscheduled in one cluster into tracks of others, and improved
+    by `engine` (taboo search by default) on the whole instance. Of `time_limit` and `iterations`
+    the global search gets `final_share`, clusters the rest; clusters waiting for a free worker
+    (with fewer `workers` than clusters) get only what is left of their share. `on_checkpoint(seconds, solution)` is called
+    once each of `checkpoints` seconds passes, with solver's initial solution while clusters are solved
+    and with the best solution of global search after that. Returns (solution, statistics)."""
+    if engine is None:
+        engine = TabooEngine()
+    checkpoints = sorted(checkpoints) if on_checkpoint else []
+    start = time.time()
+    clusters = assign_vehicles(solver, find_clusters(solver, cluster_count), solver.initial_solution)
+    cluster_deadline = None if time_limit is None else start + time_limit * (1 - final_share)
+    cluster_seeds = np.random.SeedSequence(seed).generate_state(len(clusters)).tolist()
+
+    with ProcessPoolExecutor(max_workers=workers or len(clusters)) as executor:
+        futures = [executor.submit(_solve_cluster, cluster.instance(solver), cluster.schedule(solver.initial_solution),
+                                   solver.backend, cluster_seed, engine, iterations, cluster_deadline)
+                   for cluster, cluster_seed in zip(clusters, cluster_seeds)]
+        pending = futures
+        while pending:
+            timeout = max(0.0, checkpoints[0] - (time.time() - start)) if checkpoints else None
+            _, pending = wait(pending, timeout=timeout)
+            while checkpoints and checkpoints[0] <= time.time() - start:
+                on_checkpoint(checkpoints.pop(0), solver.initial_solution)
+        schedules = [future.result() for future in futures]
+
+    merged = [[] for _ in range(solver.track_count)]
+    for cluster, schedule in zip(clusters, schedules):
+        for t, track in zip(cluster.tracks, schedule):
+            merged[t] = [cluster.vehicles[v] for v in track]
+    initial_solution = solver.initial_solution
+    solver.initial_solution = solver.repair_solution(merged)
+    merged_fitness = solver.fitness_func(solver.initial_solution)
+
+    final_iterations = None if iterations is None else max(1, int(iterations * final_share))
+    final_time_limit = None if time_limit is None else max(0.0, time_limit - (time.time() - start))
+    # remaining checkpoints measured from start of global search
+    offset = time.time() - start
+    final_checkpoints = {seconds - offset: seconds for seconds in checkpoints}
+    try:
+        solution = engine.run(solver, final_iterations, time_limit=final_time_limit, checkpoints=final_checkpoints,
+                              on_checkpoint=lambda seconds, solution: on_checkpoint(final_checkpoints[seconds],
+                                                                                    solution))
+    finally:
+        solver.initial_solution = initial_solution
+
+    statistics = {
+        'clusters': [{'tracks': len(cluster.tracks), 'vehicles': len(cluster.vehicles),
+                      'unscheduled': len(cluster.vehicles) - sum(len(track) for track in schedule)}
+                     for cluster, schedule in zip(clusters, schedules)],
+        'merged_fitness': float(merged_fitness),
+        'fitness': float(solver.fitness_func(solution)),
+        'runtime': time.time() - start,
+    }
+    return solution, statistics
@@ -0,0 +1,174 @@
+import abc
+import collections
+import math
+import time
+
+
+class Engine(abc.ABC):
+    """Search engine that improves solver's initial solution.
+
+    `run` stops after `iterations` iterations (None for no limit), after `time_limit` seconds
+    or, if `target_fitness` is set, as soon as a solution that good is found, and returns the
+    best solution found. `on_checkpoint(seconds, solution)` is called with the best solution
+    found so far once each of `checkpoints` seconds passes. `on_improvement(iteration, solution)`
+    is called whenever better solution is found and search stops early once `cancel`
+    (e.g. threading.Event) is set."""
+    # iterations of run in main.py when neither iteration nor time limit is given
+    default_iterations = None
+
+    @abc.abstractmethod
+    def run(self, solver, iterations=None, time_limit=None, target_fitness=None, checkpoints=(), on_checkpoint=None,
+            on_improvement=None, cancel=None):
+        pass
+
+
+class TabooEngine(Engine):
+    """Solver.taboo_search, one iteration scores a whole neighbourhood."""
+    default_iterations = 300
+
+    def __init__(self, taboo_duration=50, neighbourhood_length=100, reset_iteration=50, workers=None):
+        self.taboo_duration = taboo_duration
+        self.neighbourhood_length = neighbourhood_length
+        self.reset_iteration = reset_iteration
+        self.workers = workers
+
+    def run(self, solver, iterations=None, time_limit=None, target_fitness=None, checkpoints=(), on_checkpoint=None,
+            on_improvement=None, cancel=None):
+        return solver.taboo_search(self.taboo_duration, iterations, self.neighbourhood_length, self.reset_iteration,
+                                   workers=self.workers, target_fitness=target_fitness, time_limit=time_limit,
+                                   checkpoints=checkpoints, on_checkpoint=on_checkpoint,
+                                   on_improvement=on_improvement, cancel=cancel)
+
+
+class SingleMoveEngine(Engine):
+    """Engine that samples, scores and accepts or rejects one move per iteration.
+
+    Accepted moves are applied in place to the current solution, only improvements of the best
+    solution are copied. Subclasses decide acceptance in `accept`."""
+    default_iterations = 30000
+
+    def __init__(self, insertion_rate=0.1):
+        # probability that sampled move inserts unscheduled vehicle
+        self.insertion_rate = insertion_rate
+
+    def start(self, solver, fitness):
+        """Called once before search with fitness of initial solution."""
+
+    @abc.abstractmethod
+    def accept(self, solver, current_fitness, candidate_fitness, iteration, progress):
+        """Returns True if candidate replaces current solution.
+
+        `progress` is share of iteration or time limit already used, from 0 to 1."""
+
+    def run(self, solver, iterations=None, time_limit=None, target_fitness=None, checkpoints=(), on_checkpoint=None,
+            on_improvement=None, cancel=None):
+        if iterations is None and time_limit is None and target_fitness is None:
+            raise ValueError('Search needs iteration, time or fitness limit!')
+        start = time.monotonic()
+        checkpoints = collections.deque(sorted(checkpoints) if on_checkpoint else [])
+        telemetry = solver.telemetry
+
+        best_solution = solver.initial_solution
+        best_fitness = solver.fitness_from_components(solver.goal_components(best_solution))
+        current_solution = best_solution.copy()
+        current_fitness = best_fitness
+        self.start(solver, current_fitness)
+        if telemetry is not None:
+            telemetry.record('best', iteration=0, fitness=float(best_fitness))
+
+        iteration = 0
+        progress = 0.0
+        while iterations is None or iteration < iterations:
+            move = solver.sample_move(current_solution, self.insertion_rate)
+            if move is None:
+                # there is no valid move from current solution
+                break
+            components = solver.move_components(current_solution, move)
+            fitness = solver.fitness_from_components(components)
+            if telemetry is not None:
+                telemetry.count('fitness_evaluations')
+            if self.accept(solver, current_fitness, fitness, iteration, progress):
+                solver.apply_move(current_solution, move, components)
+                current_fitness = fitness
+                if telemetry is not None:
+                    telemetry.count('accepted_moves')
+                if best_fitness < fitness:
+                    best_solution = current_solution.copy()
+                    best_fitness = fitness
+                    if telemetry is not None:
+                        telemetry.record('best', iteration=iteration + 1, fitness=float(best_fitness))
+                    if on_improvement is not None:
+                        on_improvement(iteration + 1, best_solution)
+
+            iteration += 1
+            if target_fitness is not None and best_fitness >= target_fitness:
+                break
+            if cancel is not None and cancel.is_set():
+                break
+            elapsed = time.monotonic() - start
+            while checkpoints and checkpoints[0] <= elapsed:
+                on_checkpoint(checkpoints.popleft(), best_solution)
+            if time_limit is not None:
+                if elapsed >= time_limit:
+                    break
+                progress = elapsed / time_limit
+            if iterations is not None:
+                progress = max(progress, iteration / iterations)
+
+        while checkpoints and (time_limit is None or checkpoints[0] <= time_limit):
+            on_checkpoint(checkpoints.popleft(), best_solution)
+        if telemetry is not None:
+            telemetry.count('iterations', iteration)
+            telemetry.record_summary()
+        return best_solution
+
+
+class LateAcceptanceEngine(SingleMoveEngine):
+    """Late acceptance hill climbing.
+
+    Candidate is accepted if it is not worse than the current solution or than the current
+    solution was `history_length` iterations ago."""
+    def __init__(self, history_length=1000, insertion_rate=0.1):
+        super().__init__(insertion_rate)
+        self.history_length = history_length
+        self.history = None
+
+    def start(self, solver, fitness):
+        self.history = [fitness] * self.history_length
+
+    def accept(self, solver, current_fitness, candidate_fitness, iteration, progress):
+        slot = iteration % self.history_length
+        accepted = candidate_fitness >= current_fitness or candidate_fitness >= self.history[slot]
+        self.history[slot] = candidate_fitness if accepted else current_fitness
+        return accepted
+
+
+class SimulatedAnnealingEngine(SingleMoveEngine):
+    """Simulated annealing with temperature falling geometrically from `initial_temperature`
+    to `final_temperature` over the iteration or time limit.
+
+    Without either limit temperature falls by `cooling_rate` every iteration."""
+    def __init__(self, initial_temperature=0.01, final_temperature=1e-5, cooling_rate=0.9995, insertion_rate=0.1):
+        super().__init__(insertion_rate)
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.cooling_rate = cooling_rate
+
+    def temperature(self, iteration, progress):
+        if progress > 0:
+            return self.initial_temperature * (self.final_temperature / self.initial_temperature) ** progress
+        return max(self.initial_temperature * self.cooling_rate ** iteration, self.final_temperature)
+
+    def accept(self, solver, current_fitness, candidate_fitness, iteration, progress):
+        if candidate_fitness >= current_fitness:
+            return True
+        temperature = self.temperature(iteration, progress)
+        return solver.random.random() < math.exp((candidate_fitness - current_fitness) / temperature)
+
+
+# engines selectable by name in main.py
+ENGINES = {
+    'taboo': TabooEngine,
+    'late-acceptance': LateAcceptanceEngine,
+    'annealing': SimulatedAnnealingEngine,
+}
@@ -0,0 +1,98 @@
+import argparse
+import os
+import random
+
+
+def generate_instance(vehicle_count, track_count, seed=None, series_count=3, restriction_density=0.6,
+                      blocking_share=0.3, capacity_slack=1.3):
+    """Generates random garage instance with structure similar to instances in data/ folder.
+
+    Every series has its own vehicle length and its own set of allowed tracks, a few vehicles
+    have extra restrictions. About `blocking_share` of tracks form blocking chains of two or three
+    neighbouring tracks. Track lengths are chosen so that all tracks together are
+    `capacity_slack` times longer than all vehicles. Returns instance as tuple in the same order
+    as main.load_instance."""
+    rng = random.Random(seed)
+
+    series_lengths = [rng.choice([10, 12, 15, 18]) * 3 + rng.randrange(3) for _ in range(series_count)]
+    vehicle_series = [rng.randrange(series_count) + 1 for _ in range(vehicle_count)]
+    vehicle_lengths = [series_lengths[series - 1] for series in vehicle_series]
+
+    # every series can park on its own subset of tracks, some tracks take every series
+    series_restrictions = []
+    for _ in range(series_count):
+        row = [rng.random() < restriction_density for _ in range(track_count)]
+        row[rng.randrange(track_count)] = True
+        series_restrictions.append(row)
+    vehicle_restrictions = []
+    for series in vehicle_series:
+        row = list(series_restrictions[series - 1])
+        if rng.random() < 0.05:
+            # vehicle with additional restriction
+            allowed = [t for t in range(track_count) if row[t]]
+            if len(allowed) > 1:
+                row[rng.choice(allowed)] = False
+        vehicle_restrictions.append(row)
+
+    longest_vehicle = max(vehicle_lengths)
+    total_length = sum(vehicle_lengths) + 0.5 * vehicle_count
+    weights = [rng.uniform(0.6, 1.4) for _ in range(track_count)]
+    scale = capacity_slack * total_length / sum(weights)
+    track_lengths = [max(int(weight * scale), longest_vehicle) for weight in weights]
+
+    departure_times = [rng.randrange(240, 480) for _ in range(vehicle_count)]
+    schedule_type = [rng.randrange(7) for _ in range(vehicle_count)]
+
+    # chains of neighbouring tracks where first track blocks the rest
+    blocking_tracks = {}
+    track = 0
+    while track < track_count - 1:
+        if rng.random() < blocking_share / 2:
+            chain_length = min(rng.choice([2, 2, 3]), track_count - track)
+            blocking_tracks[track + 1] = list(range(track + 2, track + chain_length + 1))
+            track += chain_length
+        else:
+            track += 1
+
+    return (vehicle_count, track_count, vehicle_lengths, vehicle_series, vehicle_restrictions,
+            track_lengths, departure_times, schedule_type, blocking_tracks)
+
+
+def write_instance(file_path, instance):
+    """Writes instance tuple in text format of instance files in data/ folder."""
+    (vehicle_count, track_count, vehicle_lengths, vehicle_series, vehicle_restrictions,
+     track_lengths, departure_times, schedule_type, blocking_tracks) = instance
+
+    def line(values):
+        return ' '.join(str(value) for value in values) + ' '
+
+    lines = [str(vehicle_count), str(track_count), '', line(vehicle_lengths), '', line(vehicle_series), '']
+    lines.extend(line(int(allowed) for allowed in row) for row in vehicle_restrictions)
+    lines.extend(['', line(track_lengths), '', line(departure_times), '', line(schedule_type), ''])
+    lines.extend(' '.join(str(t) for t in [blocking] + blocked) for blocking, blocked in blocking_tracks.items())
+
+    directory_name = os.path.dirname(file_path)
+    if directory_name and not os.path.isdir(directory_name):
+        os.makedirs(directory_name)
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate random garage instance.')
+    parser.add_argument('outputfile', metavar='output_file', help='Path of generated instance file')
+    parser.add_argument('vehicles', type=int, help='Number of vehicles')
+    parser.add_argument('tracks', type=int, help='Number of tracks')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of random number generator')
+    parser.add_argument('--series', type=int, default=3, help='Number of vehicle series')
+    parser.add_argument('--density', type=float, default=0.6,
+                        help='Share of tracks each vehicle series may park on')
+    args = parser.parse_args()
+
+    instance = generate_instance(args.vehicles, args.tracks, seed=args.seed, series_count=args.series,
+                                 restriction_density=args.density)
+    write_instance(args.outputfile, instance)
+
+
+if __name__ == "__main__":
+    main()
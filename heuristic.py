@@ -1,36 +1,65 @@
 import numpy as np
 import random
+import bisect
+import collections
 import copy
+import itertools
+import time
+
+
+def _as_list(values):
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
+
+def remove_vehicles(schedule, removed_vehicles):
+    """Returns schedule without removed vehicles, remaining vehicles renumbered as in instance without them.
+
+    Vehicles are numbered from 0."""
+    removed_vehicles = sorted(set(removed_vehicles))
+    removed = set(removed_vehicles)
+    return [[v - bisect.bisect_left(removed_vehicles, v) for v in track if v not in removed] for track in schedule]
+
 
 class Solver:
     def __init__(self, vehicle_count, track_count, vehicle_lengths, vehicle_series,
                  vehicle_restrictions, track_lengths, departure_times,
-                 schedule_type, blocking_tracks):
+                 schedule_type, blocking_tracks, backend='list', build_initial_solution=True, seed=None,
+                 telemetry=None):
 
         #########################
         # Load instance data #
         #########################
+        # per vehicle and per track values are kept as lists, which are faster to index one by one
         self.vehicle_count = vehicle_count
         self.track_count = track_count
-        self.vehicle_lengths = vehicle_lengths
-        self.vehicle_series = vehicle_series
-        self.vehicle_restrictions = np.array(vehicle_restrictions)
-        self.track_lengths = track_lengths
-        self.departure_times = departure_times
-        self.schedule_type = schedule_type
+        self.vehicle_lengths = _as_list(vehicle_lengths)
+        self.vehicle_series = _as_list(vehicle_series)
+        self.vehicle_restrictions = np.asarray(vehicle_restrictions)
+        self.track_lengths = _as_list(track_lengths)
+        self.departure_times = _as_list(departure_times)
+        self.schedule_type = _as_list(schedule_type)
         self.blocking_tracks = blocking_tracks
 
+        # solution representation used by search: 'list' (Solution) or 'array' (ArraySolution)
+        if backend not in ('list', 'array'):
+            raise ValueError('Unknown solution backend {}!'.format(backend))
+        self.backend = backend
+
+        # random number generator used by search, runs with same seed are reproducible
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # telemetry.Telemetry collecting counters, timers and best fitness trace of search, None to disable
+        self.telemetry = telemetry
+
         self.track_length_sum = sum(self.track_lengths)
         self.vehicle_length_sum = sum(self.vehicle_lengths)
 
-        # tracks that are not blocking and are not blocked
-        blocked = [item - 1 for sublist in self.blocking_tracks.values() for item in sublist]
-        blocking = [item - 1 for item in self.blocking_tracks.keys()]
-        self.nonblocking_tracks = [t for t in list(range(self.track_count))
-                                   if t not in blocked + blocking]
+        # instance data precomputed for construction, validation and move generation
+        self.index = InstanceIndex(self.vehicle_restrictions, self.departure_times, self.blocking_tracks)
 
         # initial solution
-        self.initial_solution = self.generate_initial_solution()
+        self.initial_solution = self.generate_initial_solution() if build_initial_solution else None
 
     def global_goal_first(self, solution):
         # first subfunction
@@ -110,44 +139,338 @@ class Solver:
     def fitness_func(self, solution):
         return self.global_goal_second(solution) / self.global_goal_first(solution)
 
-    def generate_initial_solution(self):
-        s = Solution(self.track_count, self.track_lengths)
+    ##########################################
+    # Incremental (delta) fitness evaluation #
+    ##########################################
+    #
+    # Both global goals are sums of per-track terms (f_2, f_3, g_1, g_3 and pair count)
+    # and of terms over pairs of neighbouring used tracks (f_1, g_2). Solution keeps these
+    # component sums in `goal_components` so that a move only has to recompute the tracks
+    # it touches and the pairs those tracks form with their nearest used neighbours.
+    #
+    # Moves are tuples:
+    #   ('swap', t1, i1, t2, i2)           - swap vehicle i1 on track t1 with vehicle i2 on track t2
+    #   ('relocate', t_from, i, t_to, j)   - move vehicle i from track t_from to position j of track t_to
+    # Track index `track_count` denotes the unscheduled vehicles (sorted by vehicle number).
 
-        # generate vehicle list and sort it by departure time (this is priority!)
-        vehicles = list(range(self.vehicle_count))
-        vehicles_sorted = self.__sort_by_departure_time(vehicles)
+    def goal_components(self, solution):
+        """Returns (f_1, f_2, f_3, g_1, g_2, g_3, pair_counter) of solution, cached on the solution."""
+        if solution.goal_components is None:
+            f_2 = f_3 = g_1 = g_3 = pair_counter = 0
+            for track_index, track in enumerate(solution.schedule):
+                if len(track) > 0:
+                    _, _, t_g_1, t_g_3, t_pairs = self.__track_components(track_index, track)
+                    f_2 += 1
+                    f_3 += solution.unused_track_capacity[track_index]
+                    g_1 += t_g_1
+                    g_3 += t_g_3
+                    pair_counter += t_pairs
+            f_1, g_2 = self.__neighbouring_tracks_components(self.used_tracks(solution), solution.track)
+            solution.goal_components = (f_1, f_2, f_3, g_1, g_2, g_3, pair_counter)
+        return solution.goal_components
 
-        tracks = list(range(self.track_count))
+    def used_tracks(self, solution):
+        """Returns sorted list of indices of non empty tracks, cached on the solution."""
+        if solution.used_tracks is None:
+            solution.used_tracks = [t for t in range(self.track_count) if solution.track_size(t) > 0]
+        return solution.used_tracks
+
+    def fitness_from_components(self, components):
+        f_1, f_2, f_3, g_1, g_2, g_3, pair_counter = components
+        p_1 = 1.0 / (f_2 - 1)
+        p_2 = 1.0 / self.track_count
+        p_3 = 1.0 / (self.track_length_sum - self.vehicle_length_sum)
+        first = (p_1 * f_1) + (p_2 * f_2) + (p_3 * f_3)
+
+        r_1 = 1.0 / (self.vehicle_count - f_2)
+        r_2 = 1.0 / (f_2 - 1)
+        r_3 = 1.0 / (15 * pair_counter)
+        second = (r_1 * g_1) + (r_2 * g_2) + (r_3 * g_3)
+        return second / first
+
+    ##########################################
+    # Batch (vectorized) fitness evaluation  #
+    ##########################################
+
+    def batch_goals(self, solutions):
+        """Returns arrays of first and second global goal of every solution, computed at once.
+
+        Results are equal to global_goal_first and global_goal_second, except that solutions for
+        which those raise ZeroDivisionError get inf or nan."""
+        vehicles, counts, unused = self.__batch_arrays(solutions)
+        schedule_type = np.append(np.asarray(self.schedule_type, dtype=np.int64), -1)
+        vehicle_series = np.append(np.asarray(self.vehicle_series, dtype=np.int64), -1)
+        departure_times = np.append(np.asarray(self.departure_times, dtype=np.int64), 0)
+        tracks = np.arange(self.track_count)
+
+        used = counts > 0
+        f_2 = used.sum(axis=1)
+        f_3 = np.where(used, unused, 0.0).sum(axis=1)
+
+        # previous used track of every track, empty tracks in between are skipped
+        previous = np.maximum.accumulate(np.where(used, tracks, -1), axis=1)
+        previous = np.concatenate([np.full((len(solutions), 1), -1), previous[:, :-1]], axis=1)
+        has_previous = used & (previous >= 0)
+        adjacent = previous == tracks - 1
+        previous = np.maximum(previous, 0)
+
+        first_vehicle = vehicles[:, :, 0]
+        last_vehicle = np.take_along_axis(vehicles, np.maximum(counts - 1, 0)[:, :, None], axis=2)[:, :, 0]
+        series = vehicle_series[first_vehicle]
+        previous_series = np.take_along_axis(series, previous, axis=1)
+        previous_last = np.take_along_axis(last_vehicle, previous, axis=1)
+        # tracks separated by empty tracks are compared only for truthy values, same as scalar goals
+        f_1 = (has_previous & (adjacent | (previous_series != 0)) & (previous_series != series)).sum(axis=1)
+        g_2 = (has_previous & (adjacent | (previous_last != 0)) &
+               (schedule_type[previous_last] == schedule_type[first_vehicle])).sum(axis=1)
+
+        # consecutive vehicles in same track
+        first = vehicles[:, :, :-1]
+        second = vehicles[:, :, 1:]
+        is_pair = second >= 0
+        g_1 = (is_pair & (schedule_type[first] == schedule_type[second])).sum(axis=(1, 2))
+        departure_diff = departure_times[second] - departure_times[first]
+        gap_factor = np.where((departure_diff >= 10) & (departure_diff <= 20), 15,
+                              np.where(departure_diff > 20, 10, -4 * (10 - departure_diff)))
+        g_3 = np.where(is_pair, gap_factor, 0).sum(axis=(1, 2))
+        pair_counter = is_pair.sum(axis=(1, 2))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p_1 = 1.0 / (f_2 - 1)
+            p_2 = 1.0 / self.track_count
+            p_3 = 1.0 / (self.track_length_sum - self.vehicle_length_sum)
+            first_goal = (p_1 * f_1) + (p_2 * f_2) + (p_3 * f_3)
+
+            r_1 = 1.0 / (self.vehicle_count - f_2)
+            r_2 = 1.0 / (f_2 - 1)
+            r_3 = 1.0 / (15 * pair_counter)
+            second_goal = (r_1 * g_1) + (r_2 * g_2) + (r_3 * g_3)
+        return first_goal, second_goal
+
+    def batch_fitness(self, solutions):
+        """Returns array of fitness function of every solution, see batch_goals."""
+        first_goal, second_goal = self.batch_goals(solutions)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return second_goal / first_goal
+
+    def __batch_arrays(self, solutions):
+        # returns padded vehicles per track (-1 pads, N x T x longest track), track sizes and unused capacities
+        counts = np.zeros((len(solutions), self.track_count), dtype=np.int64)
+        for k, solution in enumerate(solutions):
+            if isinstance(solution, ArraySolution):
+                counts[k] = np.diff(solution.track_offsets[:self.track_count + 1])
+            else:
+                counts[k] = [len(track) for track in solution.schedule]
+        longest = max(int(counts.max()) if counts.size else 0, 1)
+
+        vehicles = np.full((len(solutions), self.track_count, longest), -1, dtype=np.int64)
+        for k, solution in enumerate(solutions):
+            if isinstance(solution, ArraySolution):
+                scheduled = np.flatnonzero(solution.vehicle_track < self.track_count)
+                vehicles[k, solution.vehicle_track[scheduled], solution.vehicle_position[scheduled]] = scheduled
+            else:
+                scheduled = [v for track in solution.schedule for v in track]
+                track_indices = np.repeat(np.arange(self.track_count), counts[k])
+                offsets = np.repeat(np.cumsum(counts[k]) - counts[k], counts[k])
+                vehicles[k, track_indices, np.arange(len(scheduled)) - offsets] = scheduled
+        unused = np.array([solution.unused_track_capacity for solution in solutions], dtype=np.float64)
+        return vehicles, counts, unused.reshape(len(solutions), self.track_count)
+
+    def move_components(self, solution, move):
+        """Returns goal components of solution after applying move, without applying it."""
+        f_1, f_2, f_3, g_1, g_2, g_3, pair_counter = self.goal_components(solution)
+        changed = self.move_track_contents(solution, move)
+        changed.pop(self.track_count, None)
+        old_tracks = {t: solution.track(t) for t in changed}
+
+        # per-track terms of touched tracks
+        for t, new_track in changed.items():
+            old_track = old_tracks[t]
+            if len(old_track) > 0:
+                _, _, t_g_1, t_g_3, t_pairs = self.__track_components(t, old_track)
+                f_2 -= 1
+                f_3 -= solution.unused_track_capacity[t]
+                g_1 -= t_g_1
+                g_3 -= t_g_3
+                pair_counter -= t_pairs
+            if len(new_track) > 0:
+                _, leftover, t_g_1, t_g_3, t_pairs = self.__track_components(t, new_track)
+                f_2 += 1
+                f_3 += leftover
+                g_1 += t_g_1
+                g_3 += t_g_3
+                pair_counter += t_pairs
+
+        # terms over neighbouring used tracks, only around touched tracks
+        used = self.used_tracks(solution)
+        anchors = set()
+        for t in changed:
+            position = bisect.bisect_left(used, t) - 1
+            while position >= 0 and used[position] in changed:
+                position -= 1
+            if position >= 0:
+                anchors.add(used[position])
+            position = bisect.bisect_right(used, t)
+            while position < len(used) and used[position] in changed:
+                position += 1
+            if position < len(used):
+                anchors.add(used[position])
+        before = sorted(anchors.union(t for t, track in old_tracks.items() if len(track) > 0))
+        after = sorted(anchors.union(t for t, track in changed.items() if len(track) > 0))
+        old_tracks.update((t, solution.track(t)) for t in anchors)
+        old_f_1, old_g_2 = self.__neighbouring_tracks_components(before, old_tracks.__getitem__)
+        new_f_1, new_g_2 = self.__neighbouring_tracks_components(
+            after, lambda t: changed[t] if t in changed else old_tracks[t])
+        f_1 += new_f_1 - old_f_1
+        g_2 += new_g_2 - old_g_2
+
+        return (f_1, f_2, f_3, g_1, g_2, g_3, pair_counter)
+
+    def move_track_contents(self, solution, move):
+        """Returns dict of track index -> new list of vehicles for every track touched by move."""
+        if move[0] == 'swap':
+            _, t1, i1, t2, i2 = move
+            first = list(solution.track(t1))
+            if t1 == t2:
+                first[i1], first[i2] = first[i2], first[i1]
+                return {t1: first}
+            second = list(solution.track(t2))
+            first[i1], second[i2] = second[i2], first[i1]
+            return {t1: first, t2: second}
+        else:
+            _, t_from, i, t_to, j = move
+            first = list(solution.track(t_from))
+            vehicle = first.pop(i)
+            if t_from == t_to:
+                first.insert(j, vehicle)
+                return {t_from: first}
+            second = list(solution.track(t_to))
+            second.insert(j, vehicle)
+            return {t_from: first, t_to: second}
 
-        for vehicle in vehicles_sorted:
-            track_availability = self.vehicle_restrictions[vehicle]
+    def apply_move(self, solution, move, components=None):
+        """Applies move to solution in place and updates its derived attributes.
+
+        `components` are goal components after the move if they are already known."""
+        if move[0] == 'swap':
+            _, t1, i1, t2, i2 = move
+            solution.swap(t1, i1, t2, i2)
+            touched = (t1, t2)
+        else:
+            _, t_from, i, t_to, j = move
+            solution.relocate(t_from, i, t_to, j)
+            touched = (t_from, t_to)
+
+        used = solution.used_tracks
+        insertion_index = solution.insertion_index
+        for t in set(touched):
+            if t == self.track_count:
+                continue
+            track = solution.track(t)
+            was_used = solution.series_on_track[t] is not None
+            solution.series_on_track[t] = self.vehicle_series[track[0]] if len(track) > 0 else None
+            solution.unused_track_capacity[t] = self.__track_unused_capacity(t, track)
+            if was_used != (len(track) > 0):
+                solution.used_tracks_count += 1 if len(track) > 0 else -1
+                if used is not None:
+                    if len(track) > 0:
+                        bisect.insort(used, t)
+                    else:
+                        used.remove(t)
+            if insertion_index is not None:
+                insertion_index.update(t)
+        solution.goal_components = components
+        solution.feasible_moves = None
+        return solution
+
+    def __track_unused_capacity(self, track_index, track):
+        unused_track = self.track_lengths[track_index]
+        for vehicle in track:
+            unused_track -= (self.vehicle_lengths[vehicle] + 0.5)
+        return unused_track + 0.5
+
+    def __track_components(self, track_index, track):
+        # returns (used, unused capacity, g_1, g_3, pair count) terms of single track
+        g_1 = 0
+        g_3 = 0
+        for first, second in zip(track, track[1:]):
+            if self.schedule_type[first] == self.schedule_type[second]:
+                g_1 += 1
+            g_3 += self.__get_vehicle_departure_gap_factor(first, second)
+        return (1 if len(track) > 0 else 0, self.__track_unused_capacity(track_index, track),
+                g_1, g_3, max(len(track) - 1, 0))
+
+    def __neighbouring_tracks_components(self, used_tracks, track):
+        # returns (f_1, g_2) terms over consecutive used tracks, same rules as global goals
+        f_1 = 0
+        g_2 = 0
+        for first, second in zip(used_tracks, used_tracks[1:]):
+            first_track = track(first)
+            pair_f_1, pair_g_2 = self.__pair_components(first, first_track[0], first_track[-1],
+                                                        second, track(second)[0])
+            f_1 += pair_f_1
+            g_2 += pair_g_2
+        return f_1, g_2
+
+    def __pair_components(self, first, first_track_first, first_track_last, second, second_track_first):
+        # returns (f_1, g_2) terms of used track `first` followed by used track `second`, given by
+        # their first and last vehicles
+        first_series = self.vehicle_series[first_track_first]
+        second_series = self.vehicle_series[second_track_first]
+        adjacent = second == first + 1
+        # tracks separated by empty tracks are compared only for truthy values,
+        # same as `temp_first` in global goal functions
+        f_1 = 1 if (adjacent or first_series) and first_series != second_series else 0
+        g_2 = 1 if ((adjacent or first_track_last) and
+                    self.schedule_type[first_track_last] == self.schedule_type[second_track_first]) else 0
+        return f_1, g_2
+
+    def generate_initial_solution(self, perturbation=0.0, beam_width=1):
+        """Greedy construction in order of departure.
+
+        With `perturbation` > 0 every track choice is, with that probability, replaced by a random
+        feasible choice, which gives different starting solutions for multi-start search.
+        With `beam_width` > 1 solution is built by generate_beam_solution instead."""
+        if beam_width > 1:
+            return self.generate_beam_solution(beam_width)
+        s = Solution(self.track_count, self.track_lengths)
+        index = self.index
+
+        # tracks already assigned to each vehicle series, sorted by track index
+        series_tracks = collections.defaultdict(list)
+
+        # vehicles are taken by departure time (this is priority!)
+        for vehicle in index.departure_order:
+            series = self.vehicle_series[vehicle]
+            track_availability = index.vehicle_track_bits[vehicle]
             # Get all tracks that have current vehicle series assigned to them
             # and find the best one that vehicle fits in if it exists
-            assigned_tracks = [t for t in tracks
-                               if s.series_on_track[t] == self.vehicle_series[vehicle]]
             best_capacity = None
             best_track = None
-            for t in assigned_tracks:
-                if not track_availability[t]:
+            feasible_tracks = []
+            for t in series_tracks[series]:
+                if not track_availability >> t & 1:
                     continue
                 # check for blocking tracks constraint validation
-                blocked_tracks = self.blocking_tracks.get(t + 1)
-                if blocked_tracks:
-                    invalid_flag = False
-                    for bt in blocked_tracks:
-                        if len(s.schedule[bt - 1]) > 0:
-                            if (self.departure_times[s.schedule[bt - 1][0]] <
-                                    self.departure_times[vehicle]):
-                                invalid_flag = True
-                    if invalid_flag:
-                        continue
+                invalid_flag = False
+                for bt in index.blocks[t]:
+                    if len(s.schedule[bt]) > 0:
+                        if (self.departure_times[s.schedule[bt][0]] <
+                                self.departure_times[vehicle]):
+                            invalid_flag = True
+                            break
+                if invalid_flag:
+                    continue
 
                 new_capacity = s.unused_track_capacity[t] - self.vehicle_lengths[vehicle] - 0.5
                 if new_capacity < 0:
                     continue
-                elif best_capacity is None or best_capacity > new_capacity:
+                feasible_tracks.append((t, new_capacity))
+                if best_capacity is None or best_capacity > new_capacity:
                     best_capacity = new_capacity
                     best_track = t
+            if perturbation and feasible_tracks and self.random.random() < perturbation:
+                best_track, best_capacity = self.random.choice(feasible_tracks)
 
             if best_track is not None:
                 s.unused_track_capacity[best_track] = best_capacity
@@ -156,13 +479,10 @@ class Solver:
             # no track in assigned track was found, need to assign new track to this vehicle series
             else:
                 # generate list of tracks that current vehicle can park on
-                available_tracks = [t for t in tracks
-                                    if track_availability[t] and s.series_on_track[t] is None]
+                available_tracks = [t for t in index.vehicle_tracks[vehicle] if s.series_on_track[t] is None]
                 # get blocking and non blocking tracks first, if there is no such track left,
                 # only then take from blocked tracks
-                blocking_tracks = [t - 1 for t in self.blocking_tracks.keys()]
-                usable_tracks = [t for t in available_tracks
-                                 if t in self.nonblocking_tracks + blocking_tracks]
+                usable_tracks = [t for t in available_tracks if t in index.preferred_tracks]
                 if len(usable_tracks) == 0:
                     usable_tracks = available_tracks
                 # find track that can store smallest number of vehicle series and use that one
@@ -170,162 +490,633 @@ class Solver:
                 best_can_hold_types = self.vehicle_count + 1
                 best_track = None
                 for t in usable_tracks:
-                    can_hold_types = list(self.vehicle_restrictions[:, t]).count(True)
+                    can_hold_types = index.track_compatibility[t]
                     if (can_hold_types < best_can_hold_types and
                             self.vehicle_lengths[vehicle] <= self.track_lengths[t]):
                         best_can_hold_types = can_hold_types
                         best_track = t
+                if perturbation and best_track is not None and self.random.random() < perturbation:
+                    best_track = self.random.choice([t for t in usable_tracks
+                                                     if self.vehicle_lengths[vehicle] <= self.track_lengths[t]])
 
                 if best_track is not None:
                     s.unused_track_capacity[best_track] -= self.vehicle_lengths[vehicle]
-                    s.series_on_track[best_track] = self.vehicle_series[vehicle]
+                    s.series_on_track[best_track] = series
                     s.used_tracks_count += 1
                     s.schedule[best_track].append(vehicle)
+                    bisect.insort(series_tracks[series], best_track)
                 else:
                     s.unscheduled_vehicles.add(vehicle)
 
-        return s
+        return self.to_backend(s)
+
+    def generate_beam_solution(self, beam_width, branching=3):
+        """Beam search construction in order of departure, keeps `beam_width` best partial solutions.
+
+        Every partial solution is extended by up to `branching` tightest existing tracks of vehicle
+        series and up to `branching` new tracks with fewest compatible vehicles, as greedy construction
+        would choose them, or vehicle stays unscheduled if there is no such track. Partial solutions
+        are ranked by unscheduled vehicles, then by fitness estimated from their goal components, which
+        are updated incrementally as vehicles are parked. Partial solution built by greedy choices alone
+        always stays in the beam, so result is never worse than greedy construction and beam of width 1
+        builds the same solution as greedy construction.
+        Of the complete solutions the one with fewest unscheduled vehicles and best fitness is returned."""
+        index = self.index
+        greedy_state = BeamState.initial(self.track_count, self.track_lengths)
+        beam = [greedy_state]
 
-    def __sort_by_departure_time(self, target_list):
-        zipped_pairs = zip(self.departure_times, target_list)
-        z = [x for _, x in sorted(zipped_pairs)]
-        return z
+        for vehicle in index.departure_order:
+            series = self.vehicle_series[vehicle]
+            length = self.vehicle_lengths[vehicle]
+            track_availability = index.vehicle_track_bits[vehicle]
+            children = []
+            greedy_child = None
+            for state in beam:
+                first_child = len(children)
+                # tightest existing tracks of vehicle series that vehicle fits in
+                existing = []
+                for t in state.series_tracks.get(series, ()):
+                    if not track_availability >> t & 1:
+                        continue
+                    if any(state.first_vehicle[bt] is not None and
+                           self.departure_times[state.first_vehicle[bt]] < self.departure_times[vehicle]
+                           for bt in index.blocks[t]):
+                        continue
+                    new_capacity = state.unused_track_capacity[t] - length - 0.5
+                    if new_capacity >= 0:
+                        existing.append((new_capacity, t))
+                existing.sort()
+                for new_capacity, t in existing[:branching]:
+                    children.append(self.__beam_child(state, vehicle, t, new_capacity))
+
+                # new tracks, blocking and non blocking tracks first, blocking tracks only if vehicle
+                # departs before first vehicles of tracks they block
+                available_tracks = [t for t in index.vehicle_tracks[vehicle] if state.series_on_track[t] is None and
+                                    not any(state.first_vehicle[bt] is not None and
+                                            self.departure_times[state.first_vehicle[bt]] <
+                                            self.departure_times[vehicle] for bt in index.blocks[t])]
+                usable_tracks = [t for t in available_tracks if t in index.preferred_tracks]
+                if len(usable_tracks) == 0:
+                    usable_tracks = available_tracks
+                new_tracks = sorted((index.track_compatibility[t], t) for t in usable_tracks
+                                    if length <= self.track_lengths[t])
+                for _, t in new_tracks[:branching]:
+                    children.append(self.__beam_child(state, vehicle, t, self.track_lengths[t] - length, series))
+
+                if not existing and not new_tracks:
+                    children.append(state.extend(vehicle, None))
+                if state is greedy_state:
+                    # children are generated in order of greedy preference
+                    greedy_child = children[first_child]
+
+            # stable sort keeps greedy preference among equally ranked partial solutions
+            children.sort(key=BeamState.rank)
+            beam = []
+            seen = set()
+            for state in children:
+                # partial solutions with same free capacity, series and first vehicle of every track
+                # can be completed the same way
+                key = (tuple(state.unused_track_capacity), tuple(state.series_on_track), tuple(state.first_vehicle))
+                if key in seen:
+                    continue
+                seen.add(key)
+                beam.append(state)
+                if len(beam) == beam_width:
+                    break
+            if not any(state is greedy_child for state in beam):
+                if len(beam) < beam_width:
+                    beam.append(greedy_child)
+                else:
+                    beam[-1] = greedy_child
+            greedy_state = greedy_child
+
+        solutions = [self.to_backend(state.solution(self.track_count, self.track_lengths)) for state in beam]
+        return max(solutions, key=lambda s: (-len(s.unscheduled_vehicles), self.fitness_func(s)))
+
+    def __beam_child(self, state, vehicle, track, unused_capacity, new_series=None):
+        # state after vehicle is parked at the end of track, goal components are updated only for
+        # the track and the pairs it forms with its nearest used neighbours
+        f_1, f_2, f_3, g_1, g_2, g_3, pair_counter = state.components
+        first_vehicle = state.first_vehicle
+        last_vehicle = state.last_vehicle
+        used_tracks = state.used_tracks
+        position = bisect.bisect_left(used_tracks, track)
+        if new_series is None:
+            last = last_vehicle[track]
+            f_3 -= self.vehicle_lengths[vehicle] + 0.5
+            if self.schedule_type[last] == self.schedule_type[vehicle]:
+                g_1 += 1
+            g_3 += self.__get_vehicle_departure_gap_factor(last, vehicle)
+            pair_counter += 1
+            if position + 1 < len(used_tracks):
+                following = used_tracks[position + 1]
+                g_2 += (self.__pair_components(track, first_vehicle[track], vehicle, following,
+                                               first_vehicle[following])[1] -
+                        self.__pair_components(track, first_vehicle[track], last, following,
+                                               first_vehicle[following])[1])
+        else:
+            f_2 += 1
+            f_3 += unused_capacity
+            previous = used_tracks[position - 1] if position > 0 else None
+            following = used_tracks[position] if position < len(used_tracks) else None
+            pairs = []
+            if previous is not None:
+                pairs.append((1, previous, first_vehicle[previous], last_vehicle[previous], track, vehicle))
+            if following is not None:
+                pairs.append((1, track, vehicle, vehicle, following, first_vehicle[following]))
+                if previous is not None:
+                    pairs.append((-1, previous, first_vehicle[previous], last_vehicle[previous], following,
+                                  first_vehicle[following]))
+            for sign, *pair in pairs:
+                pair_f_1, pair_g_2 = self.__pair_components(*pair)
+                f_1 += sign * pair_f_1
+                g_2 += sign * pair_g_2
+            used_tracks = used_tracks[:position] + [track] + used_tracks[position:]
+        components = (f_1, f_2, f_3, g_1, g_2, g_3, pair_counter)
+        return state.extend(vehicle, track, unused_capacity, new_series, components, used_tracks,
+                            self.__estimated_fitness(components))
+
+    def __estimated_fitness(self, components):
+        # fitness_from_components with denominators that are still zero in partial solutions kept at one
+        f_1, f_2, f_3, g_1, g_2, g_3, pair_counter = components
+        first = f_1 / max(f_2 - 1, 1) + f_2 / self.track_count + f_3 / (self.track_length_sum - self.vehicle_length_sum)
+        second = (g_1 / max(self.vehicle_count - f_2, 1) + g_2 / max(f_2 - 1, 1) +
+                  g_3 / (15 * max(pair_counter, 1)))
+        return second / first
+
+    def repair_solution(self, schedule):
+        """Returns valid solution close to schedule, e.g. previous result of instance that has changed since.
+
+        `schedule` is list of tracks with vehicles numbered from 0. Unknown and repeated vehicles are
+        dropped. Tracks that are still valid are kept as they are, other tracks are reordered by departure
+        time and vehicles breaking restrictions, series or capacity of track are taken out, then vehicles
+        breaking blocking relations. Vehicles taken out and vehicles missing from schedule are inserted
+        again one by one, always by the best insertion found by rank_insertions."""
+        s = Solution(self.track_count, self.track_lengths)
+        seen = set()
+        for t, track in enumerate(schedule[:self.track_count]):
+            track = [v for v in track if 0 <= v < self.vehicle_count and v not in seen]
+            seen.update(track)
+            if self.__track_violation(t, track, self.__track_unused_capacity(t, track)):
+                track = self.__repair_track(t, track)
+            s.schedule[t] = track
+
+        # vehicles leave end of blocking track until it departs before blocked track, this never
+        # breaks other blocking relations
+        repaired = True
+        while repaired:
+            repaired = False
+            for blocking_track, blocked_tracks in self.blocking_tracks.items():
+                for blocked_track in blocked_tracks:
+                    while self.__blocking_violation(blocking_track, blocked_track, s.schedule[blocking_track - 1],
+                                                    s.schedule[blocked_track - 1]):
+                        s.schedule[blocking_track - 1].pop()
+                        repaired = True
+
+        scheduled = set(v for track in s.schedule for v in track)
+        s.unscheduled_vehicles = set(v for v in range(self.vehicle_count) if v not in scheduled)
+        s = self.update_solution(s)
+        while s.unscheduled_vehicles:
+            ranked = self.rank_insertions(s)
+            if not ranked:
+                break
+            _, move, components = ranked[0]
+            s = self.apply_move(s, move, components)
+        return self.to_backend(s)
+
+    def __repair_track(self, track_index, track):
+        # keeps vehicles allowed on track and of its most common series, ordered by departure time,
+        # last departing vehicles leave track while it is over capacity
+        track = [v for v in track if self.index.vehicle_track_bits[v] >> track_index & 1]
+        if len(track) == 0:
+            return track
+        series_count = collections.Counter(self.vehicle_series[v] for v in track)
+        series = max(series_count, key=lambda s: (series_count[s], s == self.vehicle_series[track[0]]))
+        track = sorted((v for v in track if self.vehicle_series[v] == series), key=lambda v: self.departure_times[v])
+        while track and self.__track_unused_capacity(track_index, track) < 0:
+            track.pop()
+        return track
 
     def is_valid(self, solution):
         """This function checks if solution respects all of constraints."""
         tracks = list(range(self.track_count))
-        for track, track_index in zip(solution.schedule, tracks):
-            if len(track) > 1:
-                for first, second in zip(track, track[1:]):
-                        if self.departure_times[first] > self.departure_times[second]:
-                            return (False,
-                                    'Vehicle {} departs later than vehicle {}!'.format(first + 1,
-                                                                                       second + 1))
-                        if self.vehicle_series[first] != self.vehicle_series[second]:
-                            return (False,
-                                    'Vehicle {} is not same series as vehicle {}!'.format(first + 1,
-                                                                                          second + 1))
-            for vehicle in track:
-                if not self.vehicle_restrictions[vehicle][track_index]:
-                    return (False,
-                            'Vehicle {} is restricted to park on track {}!'.format(vehicle + 1,
-                                                                                   track_index + 1))
-            if solution.unused_track_capacity[track_index] < 0:
-                return (False,
-                        'Track {} is over its capacity!'.format(track_index + 1))
+        schedule = solution.schedule
+        for track, track_index in zip(schedule, tracks):
+            violation = self.__track_violation(track_index, track, solution.unused_track_capacity[track_index])
+            if violation:
+                return (False, violation)
         for blocking_track in self.blocking_tracks.keys():
             for blocked_track in self.blocking_tracks[blocking_track]:
-                blocking_schedule = solution.schedule[blocking_track - 1]
-                blocked_schedule = solution.schedule[blocked_track - 1]
-                if len(blocked_schedule) > 0 and len(blocking_schedule) > 0:
-                    if (self.departure_times[blocking_schedule[-1]] >
-                            self.departure_times[blocked_schedule[0]]):
-                        #print(self.departure_times[blocking_schedule[-1]])
-                        #print(self.departure_times[blocked_schedule[0]])
-                        return (False,
-                                'First vehicle in blocked track {} departs sooner than last vehicle in blocking track {}'.format(blocked_track,
-                                                                                                                                 blocking_track))
+                violation = self.__blocking_violation(blocking_track, blocked_track,
+                                                      schedule[blocking_track - 1],
+                                                      schedule[blocked_track - 1])
+                if violation:
+                    return (False, violation)
         return (True, '')
 
-    def generate_neighbourhood(self, initial_solution, neighbourhood_length):
-        neighbourhood = set()
+    def is_valid_move(self, solution, move):
+        """Checks if solution after move respects all of constraints, without applying move.
 
-        # try to add unscheduled vehicles to produce neighbourhood
-        # check if unused capacity is bigger then some of the unscheduled vehicles
-        
-        unscheduled_neighbourhood = self.generate_unscheduled_neughbourhood(initial_solution)
-        for s in unscheduled_neighbourhood:
-            if self.is_valid(s)[0] != False and s.schedule != self.initial_solution.schedule:
-                neighbourhood.add(s)
-        
-        while len(neighbourhood) < neighbourhood_length:
-            s = copy.deepcopy(initial_solution)
-            if len(self.initial_solution.unscheduled_vehicles) > 0:
-                # add unscheduled vehicles to scheduled
-                s.schedule.append(list(s.unscheduled_vehicles))
-
-            tracks_count = len(s.schedule)
-
-            # find random track
-            selected_track1_index = random.randrange(tracks_count)
-            # randomly find track and cannot choose two empty tracks
-            selected_track2_index = random.randrange(tracks_count)
-            while len(s.schedule[selected_track1_index]) == 0 and len(s.schedule[selected_track2_index]) == 0:
-                selected_track2_index = random.randrange(tracks_count)            
-
-            selected_track2_count = len(s.schedule[selected_track2_index]) 
-            selected_track1_count = len(s.schedule[selected_track1_index])
-            if selected_track1_count > 0 and selected_track2_count > 0:
-                
-                selected_vehicle1_index = random.randrange(selected_track1_count)
-                selected_vehicle2_index = random.randrange(selected_track2_count)
-
-                # swap vehicles
-                tmp = s.schedule[selected_track1_index][selected_vehicle1_index]
-                s.schedule[selected_track1_index][selected_vehicle1_index] = s.schedule[selected_track2_index][selected_vehicle2_index] 
-                s.schedule[selected_track2_index][selected_vehicle2_index] = tmp
-            elif selected_track1_count == 0:
-                # first track is empty
-                selected_vehicle2_index = random.randrange(selected_track2_count)
-                selected_vehicle2 = s.schedule[selected_track2_index].pop(selected_vehicle2_index)
-                s.schedule[selected_track1_index].append(selected_vehicle2) 
-            elif selected_track2_count == 0:
-                # second track is empty
-                selected_vehicle1_index = random.randrange(selected_track1_count)
-                selected_vehicle1 = s.schedule[selected_track1_index].pop(selected_vehicle1_index)
-                s.schedule[selected_track2_index].append(selected_vehicle1)
-            # update solution
-            # remove unscheduled vehicles
-            if len(s.unscheduled_vehicles) > 0:
-                unscheduled_vehicles =  set(s.schedule.pop())
-                s.unscheduled_vehicles = unscheduled_vehicles
-
-            s.used_tracks_count = self.count_used_tracks(s)
-            s.series_on_track = self.initialize_series_on_track(s)
-            s.unused_track_capacity = self.update_unused_track_capacity(s)
-            if self.is_valid(s)[0] != False and s.schedule != self.initial_solution.schedule:
-                neighbourhood.add(s)
-
-        return neighbourhood
+        Solution itself is expected to be valid, so only positions changed by move, capacity
+        of touched tracks and blocking relations of touched tracks are checked."""
+        # first and last vehicle of every touched track after move, None for empty track
+        ends = {}
+        if move[0] == 'swap':
+            _, t1, i1, t2, i2 = move
+            if t1 == t2:
+                if t1 == self.track_count:
+                    return (True, '')
+                track = list(solution.track(t1))
+                track[i1], track[i2] = track[i2], track[i1]
+                violation = self.__track_violation(t1, track, solution.unused_track_capacity[t1])
+                if violation:
+                    return (False, violation)
+                ends[t1] = (track[0], track[-1])
+            else:
+                track_1 = solution.track(t1)
+                track_2 = solution.track(t2)
+                vehicle_1 = track_1[i1]
+                vehicle_2 = track_2[i2]
+                for t, track, i, old, new in ((t1, track_1, i1, vehicle_1, vehicle_2),
+                                              (t2, track_2, i2, vehicle_2, vehicle_1)):
+                    if t == self.track_count:
+                        continue
+                    violation = self.__placement_violation(t, track, i, i + 1, new)
+                    if violation:
+                        return (False, violation)
+                    if solution.unused_track_capacity[t] + self.vehicle_lengths[old] - self.vehicle_lengths[new] < 0:
+                        return (False, 'Track {} is over its capacity!'.format(t + 1))
+                    ends[t] = (new if i == 0 else track[0], new if i == len(track) - 1 else track[-1])
+        else:
+            _, t_from, i, t_to, j = move
+            if t_from == t_to:
+                track = list(solution.track(t_from))
+                track.insert(j, track.pop(i))
+                violation = self.__track_violation(t_from, track, solution.unused_track_capacity[t_from])
+                if violation:
+                    return (False, violation)
+                ends[t_from] = (track[0], track[-1])
+            else:
+                track_from = solution.track(t_from)
+                vehicle = track_from[i]
+                if t_from != self.track_count:
+                    # removing vehicle never breaks order, series or capacity of its track
+                    if len(track_from) == 1:
+                        ends[t_from] = None
+                    else:
+                        ends[t_from] = (track_from[1] if i == 0 else track_from[0],
+                                        track_from[-2] if i == len(track_from) - 1 else track_from[-1])
+                if t_to != self.track_count:
+                    track_to = solution.track(t_to)
+                    violation = self.__placement_violation(t_to, track_to, j, j, vehicle)
+                    if violation:
+                        return (False, violation)
+                    if len(track_to) == 0:
+                        unused_capacity = self.track_lengths[t_to] - self.vehicle_lengths[vehicle]
+                    else:
+                        unused_capacity = solution.unused_track_capacity[t_to] - self.vehicle_lengths[vehicle] - 0.5
+                    if unused_capacity < 0:
+                        return (False, 'Track {} is over its capacity!'.format(t_to + 1))
+                    ends[t_to] = (vehicle if j == 0 else track_to[0],
+                                  vehicle if j == len(track_to) else track_to[-1])
+
+        # only blocking relations that touch changed tracks can become broken
+        for t, track_ends in ends.items():
+            if track_ends is None:
+                continue
+            for blocked_track in self.index.blocks[t]:
+                blocked_ends = self.__track_ends(solution, blocked_track, ends)
+                if (blocked_ends is not None and
+                        self.departure_times[track_ends[1]] > self.departure_times[blocked_ends[0]]):
+                    return (False, self.__blocking_message(t + 1, blocked_track + 1))
+            for blocking_track in self.index.blocked_by[t]:
+                blocking_ends = self.__track_ends(solution, blocking_track, ends)
+                if (blocking_ends is not None and
+                        self.departure_times[blocking_ends[1]] > self.departure_times[track_ends[0]]):
+                    return (False, self.__blocking_message(blocking_track + 1, t + 1))
+        return (True, '')
+
+    def __track_ends(self, solution, track_index, changed_ends):
+        if track_index in changed_ends:
+            return changed_ends[track_index]
+        if solution.track_size(track_index) == 0:
+            return None
+        track = solution.track(track_index)
+        return (track[0], track[-1])
+
+    def __placement_violation(self, track_index, track, before, after, vehicle):
+        # checks vehicle placed between track[before - 1] and track[after] of otherwise valid track
+        if not self.index.vehicle_track_bits[vehicle] >> track_index & 1:
+            return 'Vehicle {} is restricted to park on track {}!'.format(vehicle + 1, track_index + 1)
+        for first, second in ((track[before - 1] if before > 0 else None, vehicle),
+                              (vehicle, track[after] if after < len(track) else None)):
+            if first is None or second is None:
+                continue
+            if self.departure_times[first] > self.departure_times[second]:
+                return 'Vehicle {} departs later than vehicle {}!'.format(first + 1, second + 1)
+            if self.vehicle_series[first] != self.vehicle_series[second]:
+                return 'Vehicle {} is not same series as vehicle {}!'.format(first + 1, second + 1)
+        return None
+
+    def __track_violation(self, track_index, track, unused_capacity):
+        # returns message of first constraint that track breaks or None
+        if len(track) > 1:
+            for first, second in zip(track, track[1:]):
+                if self.departure_times[first] > self.departure_times[second]:
+                    return 'Vehicle {} departs later than vehicle {}!'.format(first + 1, second + 1)
+                if self.vehicle_series[first] != self.vehicle_series[second]:
+                    return 'Vehicle {} is not same series as vehicle {}!'.format(first + 1, second + 1)
+        for vehicle in track:
+            if not self.index.vehicle_track_bits[vehicle] >> track_index & 1:
+                return 'Vehicle {} is restricted to park on track {}!'.format(vehicle + 1, track_index + 1)
+        if unused_capacity < 0:
+            return 'Track {} is over its capacity!'.format(track_index + 1)
+        return None
+
+    def __blocking_violation(self, blocking_track, blocked_track, blocking_schedule, blocked_schedule):
+        # blocking_track and blocked_track are numbered from 1, same as in instance file
+        if len(blocked_schedule) > 0 and len(blocking_schedule) > 0:
+            if (self.departure_times[blocking_schedule[-1]] >
+                    self.departure_times[blocked_schedule[0]]):
+                return self.__blocking_message(blocking_track, blocked_track)
+        return None
+
+    def __blocking_message(self, blocking_track, blocked_track):
+        return ('First vehicle in blocked track {} departs sooner than last vehicle in blocking track {}'
+                .format(blocked_track, blocking_track))
+
+    def generate_moves(self, solution, neighbourhood_length):
+        """Generates up to neighbourhood_length distinct valid moves from solution.
+
+        Moves inserting unscheduled vehicles come first, then random swaps and relocations."""
+        moves = set()
+
+        # try to add unscheduled vehicles to produce neighbourhood, insertion moves are already valid
+        for move in self.generate_unscheduled_moves(solution):
+            moves.add(move)
+            yield move
+
+        yield from self.generate_random_moves(solution, neighbourhood_length, moves)
+
+    def generate_random_moves(self, solution, neighbourhood_length, moves=None, max_failed_draws=200):
+        """Generates distinct valid random swaps and relocations until `moves` holds neighbourhood_length moves.
+
+        Moves are drawn only among placements that vehicle restrictions, series and departure order
+        allow, remaining constraints are checked by is_valid_move. After `max_failed_draws` draws in
+        a row give no new valid move, remaining feasible moves are enumerated instead and generation
+        stops early once the neighbourhood is exhausted."""
+        if moves is None:
+            moves = set()
+        yield from self.__drawn_moves(solution, neighbourhood_length, moves, max_failed_draws)
+        if len(moves) < neighbourhood_length and self.vehicle_count > 0:
+            yield from self.__enumerated_moves(solution, neighbourhood_length, moves)
+
+    def __drawn_moves(self, solution, neighbourhood_length, moves, max_failed_draws):
+        # distinct valid random moves until moves holds neighbourhood_length moves or max_failed_draws
+        # draws in a row fail
+        telemetry = self.telemetry
+        # vehicles are drawn uniformly, unscheduled vehicles take part as one more track
+        track_ends = list(itertools.accumulate(solution.track_sizes()))
+        vehicle_total = track_ends[-1]
+        failed_draws = 0
+
+        while len(moves) < neighbourhood_length and vehicle_total > 0 and failed_draws < max_failed_draws:
+            position = self.random.randrange(vehicle_total)
+            track_index = bisect.bisect_right(track_ends, position)
+            vehicle_index = position - (track_ends[track_index - 1] if track_index > 0 else 0)
+            move = self.__draw_move(solution, track_index, vehicle_index)
+            if move is None:
+                failed_draws += 1
+                if telemetry is not None:
+                    telemetry.count('infeasible_draws')
+                continue
+            if move in moves:
+                failed_draws += 1
+                if telemetry is not None:
+                    telemetry.count('duplicate_moves')
+                continue
+            if telemetry is None:
+                valid = self.is_valid_move(solution, move)[0]
+            else:
+                valid = self.__record_validation(telemetry, solution, move)
+            if valid:
+                failed_draws = 0
+                moves.add(move)
+                yield move
+            else:
+                failed_draws += 1
+
+    def __move_destinations(self, solution, track_index, vehicle):
+        # tracks vehicle can be moved to, unscheduled vehicles only to tracks
+        if track_index != self.track_count and solution.track_size(self.track_count) > 0:
+            return self.index.vehicle_tracks[vehicle] + [self.track_count]
+        return self.index.vehicle_tracks[vehicle]
+
+    def __draw_move(self, solution, t1, i1):
+        # random move of vehicle on position i1 of track t1, None if drawn track has no place for it
+        track_1 = solution.track(t1)
+        vehicle = track_1[i1]
+        destinations = self.__move_destinations(solution, t1, vehicle)
+        if not destinations:
+            return None
+        t2 = destinations[self.random.randrange(len(destinations))]
+        if solution.track_size(t2) == 0:
+            return ('relocate', t1, i1, t2, 0)
+        window = self.__swap_window(t1, track_1, i1, t2, solution.track(t2))
+        if window is None:
+            return None
+        i2 = self.random.randint(*window)
+        if (t1, i1) == (t2, i2):
+            return None
+        return ('swap',) + min((t1, i1), (t2, i2)) + max((t1, i1), (t2, i2))
+
+    def __swap_window(self, t1, track_1, i1, t2, track_2):
+        """Returns (first, last) positions in track t2 whose vehicle may swap with vehicle i1 of track t1.
+
+        Window only follows from series and departure order of both valid tracks, positions outside
+        of it never give a valid swap. None if there is no such position."""
+        departure_times = self.departure_times
+        vehicle = track_1[i1]
+        first, last = 0, len(track_2) - 1
+        if t2 != self.track_count:
+            if len(track_2) > 1 and self.vehicle_series[track_2[0]] != self.vehicle_series[vehicle]:
+                return None
+            # tracks are ordered by departure time
+            departures = [departure_times[v] for v in track_2]
+            departure = departure_times[vehicle]
+            if t1 == t2:
+                # vehicles of one track can swap only if they depart at the same time
+                first = bisect.bisect_left(departures, departure)
+                last = bisect.bisect_right(departures, departure) - 1
+            else:
+                # vehicle has to depart between neighbours of its new position
+                first = max(first, bisect.bisect_left(departures, departure) - 1)
+                last = min(last, bisect.bisect_right(departures, departure))
+                if t1 != self.track_count:
+                    # and vehicle coming to track t1 between neighbours of its old position
+                    if len(track_1) > 1 and self.vehicle_series[track_2[0]] != self.vehicle_series[vehicle]:
+                        return None
+                    if i1 > 0:
+                        first = max(first, bisect.bisect_left(departures, departure_times[track_1[i1 - 1]]))
+                    if i1 < len(track_1) - 1:
+                        last = min(last, bisect.bisect_right(departures, departure_times[track_1[i1 + 1]]) - 1)
+        if first > last:
+            return None
+        return (first, last)
+
+    def __enumerated_moves(self, solution, neighbourhood_length, moves):
+        # all feasible moves not yet in moves, in random order
+        candidates = []
+        for t1 in range(self.track_count + 1):
+            track_1 = solution.track(t1)
+            for i1, vehicle in enumerate(track_1):
+                for t2 in self.__move_destinations(solution, t1, vehicle):
+                    if solution.track_size(t2) == 0:
+                        candidates.append(('relocate', t1, i1, t2, 0))
+                        continue
+                    window = self.__swap_window(t1, track_1, i1, t2, solution.track(t2))
+                    if window is None:
+                        continue
+                    # every swap is listed once, from its first position
+                    for i2 in range(max(window[0], i1 + 1) if t1 == t2 else window[0], window[1] + 1):
+                        if (t1, i1) < (t2, i2):
+                            candidates.append(('swap', t1, i1, t2, i2))
+        self.random.shuffle(candidates)
+
+        telemetry = self.telemetry
+        for move in candidates:
+            if len(moves) >= neighbourhood_length:
+                return
+            if move in moves:
+                continue
+            if telemetry is None:
+                valid = self.is_valid_move(solution, move)[0]
+            else:
+                valid = self.__record_validation(telemetry, solution, move)
+            if valid:
+                moves.add(move)
+                yield move
+        if telemetry is not None:
+            telemetry.count('exhausted_neighbourhoods')
+
+    def __record_validation(self, telemetry, solution, move):
+        start = time.perf_counter()
+        valid, violation = self.is_valid_move(solution, move)
+        telemetry.add_time('validation', time.perf_counter() - start)
+        telemetry.count('generated_moves')
+        if not valid:
+            telemetry.reject(violation)
+        return valid
+
+    def generate_unscheduled_moves(self, solution):
+        """Generates all valid moves inserting an unscheduled vehicle into a track.
+
+        Tracks with room for the vehicle are found in InsertionIndex of the solution, position in
+        track follows from vehicle departure time, is_valid_move then checks blocking relations."""
+        if solution.track_size(self.track_count) == 0:
+            return
+        insertion_index = self.insertion_index(solution)
+        telemetry = self.telemetry
+        for vehicle_index, vehicle in enumerate(solution.track(self.track_count)):
+            for track_index, first, last in insertion_index.insertion_points(vehicle):
+                for position in range(first, last + 1):
+                    move = ('relocate', self.track_count, vehicle_index, track_index, position)
+                    if telemetry is None:
+                        valid = self.is_valid_move(solution, move)[0]
+                    else:
+                        valid = self.__record_validation(telemetry, solution, move)
+                    if valid:
+                        yield move
+
+    def sample_move(self, solution, insertion_rate=0.1, max_failed_draws=50):
+        """Returns one random valid move from solution, None if solution has no valid move.
+
+        With probability `insertion_rate` move inserts random unscheduled vehicle, otherwise
+        (or if that vehicle fits nowhere) it is drawn as in generate_random_moves. Once
+        `max_failed_draws` draws in a row fail, all valid moves of solution are enumerated and kept
+        in its `feasible_moves` until it changes, so rejected candidates do not repeat the enumeration."""
+        unscheduled_count = solution.track_size(self.track_count)
+        if unscheduled_count > 0 and self.random.random() < insertion_rate:
+            vehicle_index = self.random.randrange(unscheduled_count)
+            vehicle = solution.track(self.track_count)[vehicle_index]
+            points = self.insertion_index(solution).insertion_points(vehicle)
+            if points:
+                track_index, first, last = points[self.random.randrange(len(points))]
+                move = ('relocate', self.track_count, vehicle_index, track_index, self.random.randint(first, last))
+                if self.is_valid_move(solution, move)[0]:
+                    return move
+        if solution.feasible_moves is None:
+            move = next(self.__drawn_moves(solution, 1, set(), max_failed_draws), None)
+            if move is not None:
+                return move
+            solution.feasible_moves = list(self.__enumerated_moves(solution, float('inf'), set()))
+        if not solution.feasible_moves:
+            return None
+        return solution.feasible_moves[self.random.randrange(len(solution.feasible_moves))]
+
+    def insertion_index(self, solution):
+        """Returns InsertionIndex of solution, built when first needed and kept up to date by apply_move."""
+        if solution.insertion_index is None:
+            solution.insertion_index = InsertionIndex(self, solution)
+        return solution.insertion_index
+
+    def rank_insertions(self, solution):
+        """Returns (fitness, move, components) of every valid insertion of unscheduled vehicle, best first."""
+        return sorted(self.score_moves(solution, self.generate_unscheduled_moves(solution)),
+                      key=lambda candidate: candidate[0], reverse=True)
+
+    def generate_neighbourhood(self, initial_solution, neighbourhood_length):
+        """Returns set of valid neighbour solutions, materialized from generate_moves."""
+        return set(self.apply_move(initial_solution.copy(), move)
+                   for move in self.generate_moves(initial_solution, neighbourhood_length))
 
     def generate_unscheduled_neughbourhood(self, solution):
-        unused_track_capacity = solution.unused_track_capacity
-        unscheduled_neighbourhood = []
-
-        for vehicle in solution.unscheduled_vehicles:
-            for track_number in range(0, len(solution.schedule)):
-                if unused_track_capacity[track_number] >= self.vehicle_lengths[vehicle] + 1:
-                    # vehicles can park between all other vehicles in track
-                    # add vehicle to schedule between all elements
-                    for vehicle_position in range(0, len(solution.schedule[track_number]) + 1):
-                        s = copy.deepcopy(solution)
-                        s.schedule[track_number].insert(vehicle_position, vehicle)
-                        s.unscheduled_vehicles.remove(vehicle)
-                        s = self.update_solution(s)
-                        unscheduled_neighbourhood.append(s)
-                elif unused_track_capacity[track_number] >= self.vehicle_lengths[vehicle] + 0.5:
-                    # vehicle can park as first or last in track
-                    s = copy.deepcopy(solution)
-                    s.schedule[track_number].insert(0, vehicle)
-                    s.unscheduled_vehicles.remove(vehicle)
-                    s = self.update_solution(s)
-                    unscheduled_neighbourhood.append(s)
-
-                    s = copy.deepcopy(solution)
-                    s.schedule[track_number].append()
-                    s.unscheduled_vehicles.remove(vehicle)
-                    s = self.update_solution(s)
-                    unscheduled_neighbourhood.append(s)
-
-        return unscheduled_neighbourhood
+        """Returns solutions after every valid insertion of unscheduled vehicle, best first."""
+        return [self.apply_move(solution.copy(), move, components)
+                for _, move, components in self.rank_insertions(solution)]
 
     def update_solution(self, solution):
-        s = copy.deepcopy(solution)
+        s = solution.copy()
         s.used_tracks_count = self.count_used_tracks(s)
         s.series_on_track = self.initialize_series_on_track(s)
         s.unused_track_capacity = self.update_unused_track_capacity(s)
+        s.goal_components = None
+        s.used_tracks = None
+        s.feasible_moves = None
+        s.insertion_index = None
         return s
 
+    def to_backend(self, solution):
+        """Converts list based solution into representation selected by `backend`."""
+        if self.backend == 'array':
+            return ArraySolution.from_solution(solution, self.vehicle_count)
+        return solution
+
+    def clone(self, seed=None, telemetry=None):
+        """Returns solver sharing instance data and index with this one, with its own random number
+        generator, telemetry and initial solution, so searches on clones can run concurrently."""
+        solver = copy.copy(self)
+        solver.seed = seed
+        solver.random = random.Random(seed)
+        solver.telemetry = telemetry
+        return solver
+
+    def changed(self, departure_times=None, closed_tracks=(), seed=None, telemetry=None):
+        """Returns clone of solver on instance with new departure times (list for all vehicles) and closed
+        tracks (numbered from 0) no vehicle may park on.
+
+        Index is updated only in parts the changes affect. Initial solution of the clone is None."""
+        solver = self.clone(seed, telemetry)
+        if departure_times is not None:
+            solver.departure_times = _as_list(departure_times)
+        if closed_tracks:
+            solver.vehicle_restrictions = self.vehicle_restrictions.copy()
+            solver.vehicle_restrictions[:, list(closed_tracks)] = False
+        solver.index = self.index.changed(solver.departure_times if departure_times is not None else None,
+                                          closed_tracks)
+        solver.initial_solution = None
+        return solver
+
     def count_used_tracks(self, solution):
         count = 0
         for track in solution.schedule:
@@ -350,33 +1141,383 @@ class Solver:
             unused_tracks_capacity.append(unused_track)
         return unused_tracks_capacity
 
-    def taboo_search(self, taboo_duration, iterations, neighbourhood_length, reset_iteration):
-        taboo_list = []
+    def score_moves(self, solution, moves):
+        """Yields (fitness, move, components) for every move from solution."""
+        for move in moves:
+            components = self.move_components(solution, move)
+            yield (self.fitness_from_components(components), move, components)
+
+    def move_attributes(self, solution, move):
+        """Returns tuple of (vehicle, track it leaves, track it arrives to) for vehicles moved by move."""
+        if move[0] == 'swap':
+            _, t1, i1, t2, i2 = move
+            return ((solution.track(t1)[i1], t1, t2), (solution.track(t2)[i2], t2, t1))
+        _, t_from, i, t_to, _ = move
+        return ((solution.track(t_from)[i], t_from, t_to),)
+
+    def taboo_search(self, taboo_duration, iterations, neighbourhood_length, reset_iteration, workers=None,
+                     target_fitness=None, time_limit=None, checkpoints=(), on_checkpoint=None, on_improvement=None,
+                     cancel=None):
+        """Taboo search from initial solution, returns best solution found.
+
+        Search stops after `iterations` iterations (None for no limit), after `time_limit` seconds
+        or, if `target_fitness` is set, as soon as a solution that good is found.
+        `on_checkpoint(seconds, solution)` is called with the best solution found so far once each
+        of `checkpoints` seconds passes; checkpoints not reached before search stops are reported
+        with the final solution.
+        `on_improvement(iteration, solution)` is called whenever better solution is found and search
+        stops early once `cancel` (e.g. threading.Event) is set.
+        With `workers` set neighbourhoods are generated and scored in that many worker processes."""
+        if iterations is None and time_limit is None and target_fitness is None:
+            raise ValueError('Taboo search needs iteration, time or fitness limit!')
+        arguments = (taboo_duration, iterations, neighbourhood_length, reset_iteration, target_fitness,
+                     time_limit, sorted(checkpoints) if on_checkpoint else [], on_checkpoint, on_improvement, cancel)
+        if workers:
+            from parallel import ParallelEvaluator
+            with ParallelEvaluator(self, workers) as evaluator:
+                return self.__taboo_search(evaluator.score_neighbourhood, *arguments)
+        return self.__taboo_search(self.score_neighbourhood, *arguments)
+
+    def score_neighbourhood(self, solution, neighbourhood_length, taboo_list=None):
+        # taboo moves are skipped by the caller, taboo_list is used only by ParallelEvaluator
+        telemetry = self.telemetry
+        if telemetry is None:
+            return self.score_moves(solution, self.generate_moves(solution, neighbourhood_length))
+        # neighbourhood is materialized so that generation and scoring can be timed separately,
+        # generation time includes validation time
+        with telemetry.timer('generation'):
+            moves = list(self.generate_moves(solution, neighbourhood_length))
+        with telemetry.timer('scoring'):
+            scored = list(self.score_moves(solution, moves))
+        telemetry.count('fitness_evaluations', len(scored))
+        return scored
+
+    def __taboo_search(self, score_neighbourhood, taboo_duration, iterations, neighbourhood_length, reset_iteration,
+                       target_fitness, time_limit, checkpoints, on_checkpoint, on_improvement, cancel):
+        start = time.monotonic()
+        deadline = None if time_limit is None else start + time_limit
+        checkpoints = collections.deque(checkpoints)
+        telemetry = self.telemetry
+
+        taboo_list = TabooList(taboo_duration)
         best_solution = self.initial_solution
+        best_fitness = self.fitness_from_components(self.goal_components(best_solution))
+        # best solution found at any moment
         current_solution = best_solution
+        current_fitness = best_fitness
         current_iteration = 0
+        if telemetry is not None:
+            telemetry.record('best', iteration=0, fitness=float(current_fitness))
 
-        while current_iteration < iterations:
-            
-            neighbourhood = self.generate_neighbourhood(best_solution, neighbourhood_length)
+        while iterations is None or current_iteration < iterations:
+            # moves are scored and checked against best_solution, only the chosen one is applied
+            parent_solution = best_solution
+            best_move = None
 
-            for neighbour in neighbourhood:
-                if not (neighbour in taboo_list) and self.fitness_func(best_solution) < self.fitness_func(neighbour):
-                    best_solution = neighbour
-                    taboo_list.insert(0, neighbour)
-                    if taboo_duration == len(taboo_list):
-                        taboo_list.pop()
+            if telemetry is not None:
+                iteration_start = time.perf_counter()
+            for fitness, move, components in score_neighbourhood(parent_solution, neighbourhood_length, taboo_list):
+                if best_fitness < fitness:
+                    attributes = self.move_attributes(parent_solution, move)
+                    if taboo_list.is_taboo(attributes):
+                        if telemetry is not None:
+                            telemetry.count('taboo_hits')
+                        continue
+                    best_move = (move, components, attributes)
+                    best_fitness = fitness
+            if telemetry is not None:
+                telemetry.add_time('neighbourhood', time.perf_counter() - iteration_start)
+                telemetry.count('iterations')
 
-            current_iteration += 1
-            if current_iteration % reset_iteration == 0 or current_iteration == iterations - 1:
-                if self.fitness_func(current_solution) < self.fitness_func(best_solution):
-                    # print('current:', current_solution)
+            if best_move is not None:
+                move, components, attributes = best_move
+                if telemetry is not None:
+                    with telemetry.timer('apply_move'):
+                        best_solution = self.apply_move(parent_solution.copy(), move, components)
+                else:
+                    best_solution = self.apply_move(parent_solution.copy(), move, components)
+                # moved vehicles may not return to tracks they left for taboo_duration moves
+                taboo_list.add((vehicle, track_from) for vehicle, track_from, _ in attributes)
+                if current_fitness < best_fitness:
                     current_solution = best_solution
+                    current_fitness = best_fitness
+                    if telemetry is not None:
+                        telemetry.record('best', iteration=current_iteration + 1, fitness=float(current_fitness))
+                    if on_improvement is not None:
+                        on_improvement(current_iteration + 1, current_solution)
+
+            current_iteration += 1
+            if current_iteration % reset_iteration == 0 or current_iteration == (iterations or 0) - 1:
                 best_solution = self.initial_solution
-            print(current_iteration)
+                best_fitness = self.fitness_from_components(self.goal_components(best_solution))
+            if target_fitness is not None and current_fitness >= target_fitness:
+                break
+            if cancel is not None and cancel.is_set():
+                break
+
+            elapsed = time.monotonic() - start
+            while checkpoints and checkpoints[0] <= elapsed:
+                on_checkpoint(checkpoints.popleft(), current_solution)
+            if deadline is not None and start + elapsed >= deadline:
+                break
+
+        while checkpoints and (time_limit is None or checkpoints[0] <= time_limit):
+            on_checkpoint(checkpoints.popleft(), current_solution)
+        if telemetry is not None:
+            telemetry.record_summary()
         return current_solution
 
 
+class InstanceIndex:
+    """Instance data precomputed once for construction, validation and move generation.
+
+    Vehicles and tracks are numbered from 0."""
+    def __init__(self, vehicle_restrictions, departure_times, blocking_tracks):
+        restrictions = np.asarray(vehicle_restrictions, dtype=bool)
+        vehicle_count, track_count = restrictions.shape
+
+        # number of vehicles that can park on each track
+        self.track_compatibility = restrictions.sum(axis=0).tolist()
+
+        # tracks each vehicle can park on, as sorted list and as bitset (bit t set if allowed)
+        self.vehicle_tracks = [np.flatnonzero(row).tolist() for row in restrictions]
+        self.vehicle_track_bits = [int.from_bytes(np.packbits(row, bitorder='little').tobytes(), 'little')
+                                   for row in restrictions]
+
+        # forward and reverse index of blocking relations:
+        # tracks that each track blocks and tracks that each track is blocked by
+        self.blocks = [[] for _ in range(track_count)]
+        self.blocked_by = [[] for _ in range(track_count)]
+        for blocking_track, blocked_tracks in blocking_tracks.items():
+            for blocked_track in blocked_tracks:
+                self.blocks[blocking_track - 1].append(blocked_track - 1)
+                self.blocked_by[blocked_track - 1].append(blocking_track - 1)
+        self.blocking = set(t for t in range(track_count) if self.blocks[t])
+        self.blocked = set(t for t in range(track_count) if self.blocked_by[t])
+
+        # tracks that are blocking or not blocked at all, used first for new vehicle series
+        self.preferred_tracks = set(t for t in range(track_count) if t in self.blocking or t not in self.blocked)
+
+        # vehicles sorted by departure time, ties by vehicle number
+        self.departure_order = sorted(range(vehicle_count), key=lambda v: (departure_times[v], v))
+
+    def changed(self, departure_times=None, closed_tracks=()):
+        """Returns index of instance with new departure times and no vehicle allowed on closed tracks.
+
+        Only the parts these changes affect are computed again, the rest is shared with this index."""
+        index = copy.copy(self)
+        if departure_times is not None:
+            index.departure_order = sorted(range(len(departure_times)), key=lambda v: (departure_times[v], v))
+        closed_tracks = set(closed_tracks)
+        if closed_tracks:
+            closed_bits = sum(1 << t for t in closed_tracks)
+            index.track_compatibility = [0 if t in closed_tracks else count
+                                         for t, count in enumerate(self.track_compatibility)]
+            index.vehicle_tracks = [[t for t in tracks if t not in closed_tracks] if bits & closed_bits else tracks
+                                    for tracks, bits in zip(self.vehicle_tracks, self.vehicle_track_bits)]
+            index.vehicle_track_bits = [bits & ~closed_bits for bits in self.vehicle_track_bits]
+        return index
+
+
+class BeamState:
+    """Partial solution of beam search construction.
+
+    Decisions are kept as linked chain shared with parent state, per track lists are copied
+    only when state changes them. `components` are goal components of the partial solution as in
+    Solver.goal_components, `fitness` is fitness estimated from them."""
+    __slots__ = ('decisions', 'unused_track_capacity', 'series_on_track', 'first_vehicle', 'last_vehicle',
+                 'series_tracks', 'used_tracks', 'unscheduled_count', 'used_tracks_count', 'components', 'fitness')
+
+    @classmethod
+    def initial(cls, track_count, track_lengths):
+        state = cls()
+        state.decisions = None
+        state.unused_track_capacity = list(track_lengths)
+        state.series_on_track = [None] * track_count
+        state.first_vehicle = [None] * track_count
+        state.last_vehicle = [None] * track_count
+        state.series_tracks = {}
+        state.used_tracks = []
+        state.unscheduled_count = 0
+        state.used_tracks_count = 0
+        state.components = (0, 0, 0, 0, 0, 0, 0)
+        state.fitness = float('-inf')
+        return state
+
+    def rank(self):
+        return (self.unscheduled_count, -self.fitness)
+
+    def extend(self, vehicle, track, unused_capacity=None, new_series=None, components=None, used_tracks=None,
+               fitness=None):
+        """Returns state after vehicle is parked at the end of track, or left unscheduled if track is None.
+
+        `new_series` is set when track is empty and vehicle starts vehicle series on it. `components`,
+        `used_tracks` and `fitness` of the new state are computed by Solver."""
+        state = BeamState()
+        state.decisions = (self.decisions, vehicle, track)
+        state.unused_track_capacity = self.unused_track_capacity
+        state.series_on_track = self.series_on_track
+        state.first_vehicle = self.first_vehicle
+        state.last_vehicle = self.last_vehicle
+        state.series_tracks = self.series_tracks
+        state.used_tracks = self.used_tracks
+        state.unscheduled_count = self.unscheduled_count
+        state.used_tracks_count = self.used_tracks_count
+        state.components = self.components
+        state.fitness = self.fitness
+        if track is None:
+            state.unscheduled_count += 1
+            return state
+        state.components = components
+        state.used_tracks = used_tracks
+        state.fitness = fitness
+        state.unused_track_capacity = self.unused_track_capacity.copy()
+        state.unused_track_capacity[track] = unused_capacity
+        state.last_vehicle = self.last_vehicle.copy()
+        state.last_vehicle[track] = vehicle
+        if new_series is not None:
+            state.series_on_track = self.series_on_track.copy()
+            state.series_on_track[track] = new_series
+            state.first_vehicle = self.first_vehicle.copy()
+            state.first_vehicle[track] = vehicle
+            state.series_tracks = dict(self.series_tracks)
+            series_tracks = list(self.series_tracks.get(new_series, ()))
+            bisect.insort(series_tracks, track)
+            state.series_tracks[new_series] = series_tracks
+            state.used_tracks_count += 1
+        return state
+
+    def solution(self, track_count, track_lengths):
+        s = Solution(track_count, track_lengths)
+        decisions = []
+        node = self.decisions
+        while node is not None:
+            node, vehicle, track = node
+            decisions.append((vehicle, track))
+        for vehicle, track in reversed(decisions):
+            if track is None:
+                s.unscheduled_vehicles.add(vehicle)
+            else:
+                s.schedule[track].append(vehicle)
+        s.unused_track_capacity = list(self.unused_track_capacity)
+        s.series_on_track = list(self.series_on_track)
+        s.used_tracks_count = self.used_tracks_count
+        return s
+
+
+class InsertionIndex:
+    """Tracks of one solution ordered by room for another vehicle, separately for every series on them.
+
+    Empty tracks are kept under series None. Room is the length of the longest vehicle that still
+    fits on the track, so it does not depend on how unused capacity of empty tracks is stored.
+    Index is kept in solution's `insertion_index` and updated by Solver.apply_move for changed tracks,
+    tracks with room for a vehicle are found by bisection."""
+    def __init__(self, solver, solution):
+        self.solver = solver
+        self.solution = solution
+        # track -> (series, room) it is indexed under
+        self.track_keys = [self.__key(t) for t in range(solver.track_count)]
+        entries = collections.defaultdict(list)
+        for t, (series, room) in enumerate(self.track_keys):
+            entries[series].append((room, t))
+        # series -> (room, track) in ascending order
+        self.entries = {series: sorted(series_entries) for series, series_entries in entries.items()}
+        # departure times of vehicles in used tracks, filled when track is first needed
+        self.departures = {}
+
+    def __key(self, track_index):
+        series = self.solution.series_on_track[track_index]
+        if series is None:
+            return None, self.solver.track_lengths[track_index]
+        # inserted vehicle takes its length and one more gap
+        return series, self.solution.unused_track_capacity[track_index] - 0.5
+
+    def copy(self, solution):
+        """Returns index of solution copy, which has the same tracks."""
+        index = InsertionIndex.__new__(InsertionIndex)
+        index.solver = self.solver
+        index.solution = solution
+        index.track_keys = self.track_keys.copy()
+        index.entries = {series: series_entries.copy() for series, series_entries in self.entries.items()}
+        index.departures = self.departures.copy()
+        return index
+
+    def update(self, track_index):
+        """Moves track to its new place after its vehicles changed."""
+        series, room = self.track_keys[track_index]
+        series_entries = self.entries[series]
+        del series_entries[bisect.bisect_left(series_entries, (room, track_index))]
+        key = self.track_keys[track_index] = self.__key(track_index)
+        bisect.insort(self.entries.setdefault(key[0], []), (key[1], track_index))
+        self.departures.pop(track_index, None)
+
+    def tracks_with_room(self, series, length):
+        """Returns tracks of series (None for empty tracks) where vehicle of given length fits."""
+        series_entries = self.entries.get(series)
+        if not series_entries:
+            return []
+        return [t for _, t in series_entries[bisect.bisect_left(series_entries, (length, -1)):]]
+
+    def insertion_points(self, vehicle):
+        """Returns (track, first, last) for every track vehicle may be inserted into at positions first to last.
+
+        Positions respect vehicle restrictions, series, capacity and departure order, but not blocking."""
+        solver = self.solver
+        length = solver.vehicle_lengths[vehicle]
+        track_bits = solver.index.vehicle_track_bits[vehicle]
+        departure = solver.departure_times[vehicle]
+        candidates = self.tracks_with_room(solver.vehicle_series[vehicle], length) + self.tracks_with_room(None, length)
+        points = []
+        for track_index in sorted(candidates):
+            if not track_bits >> track_index & 1:
+                continue
+            if self.solution.series_on_track[track_index] is None:
+                points.append((track_index, 0, 0))
+                continue
+            departures = self.departures.get(track_index)
+            if departures is None:
+                departures = [solver.departure_times[v] for v in self.solution.track(track_index)]
+                self.departures[track_index] = departures
+            points.append((track_index, bisect.bisect_left(departures, departure),
+                           bisect.bisect_right(departures, departure)))
+        return points
+
+
+class TabooList:
+    """Taboo memory of (vehicle, track) attributes with constant time membership.
+
+    Every added move contributes its attributes, the oldest move is evicted once more than
+    `duration` moves are remembered."""
+    def __init__(self, duration):
+        self.duration = duration
+        self.moves = collections.deque()
+        self.attribute_counts = {}
+
+    def __contains__(self, attribute):
+        return attribute in self.attribute_counts
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, attributes):
+        attributes = tuple(attributes)
+        self.moves.append(attributes)
+        for attribute in attributes:
+            self.attribute_counts[attribute] = self.attribute_counts.get(attribute, 0) + 1
+        while len(self.moves) > self.duration:
+            for attribute in self.moves.popleft():
+                self.attribute_counts[attribute] -= 1
+                if self.attribute_counts[attribute] == 0:
+                    del self.attribute_counts[attribute]
+
+    def is_taboo(self, move_attributes):
+        """Move is taboo if it puts any vehicle back on a track it recently left."""
+        for vehicle, _, track_to in move_attributes:
+            if (vehicle, track_to) in self.attribute_counts:
+                return True
+        return False
+
+
 class Solution:
     def __init__(self, track_count, track_lengths):
 
@@ -397,6 +1538,14 @@ class Solution:
         # Set of vehicles that couldn't fit anywhere
         self.unscheduled_vehicles = set()
 
+        # Cached goal function component sums and used track indices, filled by Solver
+        self.goal_components = None
+        self.used_tracks = None
+        # Cached valid swaps and relocations, filled by Solver.sample_move and cleared when solution changes
+        self.feasible_moves = None
+        # InsertionIndex of unscheduled vehicles, built by Solver.insertion_index and updated by Solver.apply_move
+        self.insertion_index = None
+
     def __str__(self):
         string_schedule = []
         for track in self.schedule:
@@ -409,6 +1558,253 @@ class Solution:
             and self.used_tracks_count == other.used_tracks_count and self.unused_track_capacity == other.unused_track_capacity)
         else:
             return False
+
+    def __hash__(self):
+        return hash((tuple(self.series_on_track), self.used_tracks_count, tuple(tuple(val) for val in self.schedule),
+                     tuple(self.unused_track_capacity), frozenset(self.unscheduled_vehicles)))
+
+    def __getstate__(self):
+        # cached moves and insertion index (which refers to solver) are not sent to other processes
+        state = self.__dict__.copy()
+        state['feasible_moves'] = None
+        state['insertion_index'] = None
+        return state
+
+    def copy(self):
+        """Returns independent copy of solution, cheaper than deepcopy."""
+        s = Solution.__new__(Solution)
+        s.series_on_track = self.series_on_track.copy()
+        s.used_tracks_count = self.used_tracks_count
+        s.unused_track_capacity = self.unused_track_capacity.copy()
+        s.schedule = [track.copy() for track in self.schedule]
+        s.unscheduled_vehicles = self.unscheduled_vehicles.copy()
+        s.goal_components = self.goal_components
+        s.used_tracks = None if self.used_tracks is None else self.used_tracks.copy()
+        s.feasible_moves = None
+        s.insertion_index = None if self.insertion_index is None else self.insertion_index.copy(s)
+        return s
+
+    def same_schedule(self, other):
+        return self.schedule == other.schedule
+
+    ###########################################################
+    # Track access, track index len(schedule) is unscheduled  #
+    ###########################################################
+
+    def track(self, track_index):
+        if track_index == len(self.schedule):
+            return sorted(self.unscheduled_vehicles)
+        return self.schedule[track_index]
+
+    def track_size(self, track_index):
+        if track_index == len(self.schedule):
+            return len(self.unscheduled_vehicles)
+        return len(self.schedule[track_index])
+
+    def track_sizes(self):
+        """Returns sizes of all tracks, unscheduled vehicles last."""
+        return [len(track) for track in self.schedule] + [len(self.unscheduled_vehicles)]
+
+    def swap(self, track_1, index_1, track_2, index_2):
+        if track_1 == track_2 == len(self.schedule):
+            return
+        vehicle_1 = self.__take(track_1, index_1)
+        vehicle_2 = self.__take(track_2, index_2)
+        self.__put(track_1, index_1, vehicle_2)
+        self.__put(track_2, index_2, vehicle_1)
+
+    def relocate(self, track_from, index, track_to, position):
+        vehicle = self.track(track_from)[index]
+        if track_from == len(self.schedule):
+            self.unscheduled_vehicles.remove(vehicle)
+        else:
+            self.schedule[track_from].pop(index)
+        if track_to == len(self.schedule):
+            self.unscheduled_vehicles.add(vehicle)
+        else:
+            self.schedule[track_to].insert(position, vehicle)
+
+    def __take(self, track_index, index):
+        vehicle = self.track(track_index)[index]
+        if track_index == len(self.schedule):
+            self.unscheduled_vehicles.remove(vehicle)
+        return vehicle
+
+    def __put(self, track_index, index, vehicle):
+        if track_index == len(self.schedule):
+            self.unscheduled_vehicles.add(vehicle)
+        else:
+            self.schedule[track_index][index] = vehicle
+
+
+class ArraySolution:
+    """Solution stored in flat NumPy buffers, interchangeable with Solution.
+
+    Vehicles are kept in `track_vehicles` grouped by track, vehicles of track t are
+    `track_vehicles[track_offsets[t]:track_offsets[t + 1]]`. Unscheduled vehicles are stored
+    sorted after the last track, as track `track_count`. `vehicle_track` and `vehicle_position`
+    map every vehicle to its track and position in that track. Copying a solution copies
+    these buffers instead of nested Python lists.
+    """
+    __slots__ = ('track_count', 'track_vehicles', 'track_offsets', 'vehicle_track', 'vehicle_position',
+                 'series_on_track', 'used_tracks_count', 'unused_track_capacity',
+                 'goal_components', 'used_tracks', 'feasible_moves', 'insertion_index')
+
+    def __init__(self, track_count, track_lengths, vehicle_count):
+        self.track_count = track_count
+
+        # all vehicles start as unscheduled
+        self.track_vehicles = np.arange(vehicle_count, dtype=np.int32)
+        self.track_offsets = np.zeros(track_count + 2, dtype=np.int64)
+        self.track_offsets[-1] = vehicle_count
+        self.vehicle_track = np.full(vehicle_count, track_count, dtype=np.int32)
+        self.vehicle_position = np.arange(vehicle_count, dtype=np.int32)
+
+        self.series_on_track = [None] * track_count
+        self.used_tracks_count = 0
+        self.unused_track_capacity = list(track_lengths)
+
+        self.goal_components = None
+        self.used_tracks = None
+        self.feasible_moves = None
+        self.insertion_index = None
+
+    @classmethod
+    def from_solution(cls, solution, vehicle_count):
+        s = cls.__new__(cls)
+        s.track_count = len(solution.schedule)
+
+        tracks = [list(track) for track in solution.schedule]
+        scheduled = set(v for track in tracks for v in track)
+        tracks.append([v for v in range(vehicle_count) if v not in scheduled])
+        sizes = [len(track) for track in tracks]
+        s.track_vehicles = np.array([v for track in tracks for v in track], dtype=np.int32)
+        s.track_offsets = np.zeros(s.track_count + 2, dtype=np.int64)
+        np.cumsum(sizes, out=s.track_offsets[1:])
+        s.vehicle_track = np.repeat(np.arange(s.track_count + 1, dtype=np.int32), sizes)[np.argsort(s.track_vehicles)]
+        s.vehicle_position = np.zeros(vehicle_count, dtype=np.int32)
+        s.vehicle_position[s.track_vehicles] = np.arange(vehicle_count) - np.repeat(s.track_offsets[:-1], sizes)
+
+        s.series_on_track = list(solution.series_on_track)
+        s.used_tracks_count = solution.used_tracks_count
+        s.unused_track_capacity = list(solution.unused_track_capacity)
+        s.goal_components = solution.goal_components
+        s.used_tracks = None if solution.used_tracks is None else list(solution.used_tracks)
+        s.feasible_moves = None
+        s.insertion_index = None
+        return s
+
+    @property
+    def schedule(self):
+        """List of tracks with lists of vehicles, built from buffers (read only)."""
+        vehicles = self.track_vehicles.tolist()
+        offsets = self.track_offsets.tolist()
+        return [vehicles[offsets[t]:offsets[t + 1]] for t in range(self.track_count)]
+
+    @property
+    def unscheduled_vehicles(self):
+        return set(self.track(self.track_count))
+
+    def __str__(self):
+        string_schedule = []
+        for track in self.schedule:
+            string_schedule.append(' '.join([str(v + 1) for v in track]) if len(track) > 0 else '')
+        return '\n'.join(string_schedule)
+
+    def __eq__(self, other):
+        if isinstance(other, ArraySolution):
+            return (self.same_schedule(other) and self.series_on_track == other.series_on_track and
+                    self.used_tracks_count == other.used_tracks_count and
+                    self.unused_track_capacity == other.unused_track_capacity)
+        else:
+            return False
+
     def __hash__(self):
-        return hash((tuple(self.series_on_track), self.used_tracks_count,(tuple(val) for val in self.schedule), tuple(self.unused_track_capacity), tuple(self.unscheduled_vehicles)))
-    pass
+        return hash((self.track_vehicles.tobytes(), self.track_offsets.tobytes()))
+
+    def __getstate__(self):
+        # cached moves and insertion index (which refers to solver) are not sent to other processes
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['feasible_moves'] = None
+        state['insertion_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def copy(self):
+        s = ArraySolution.__new__(ArraySolution)
+        s.track_count = self.track_count
+        s.track_vehicles = self.track_vehicles.copy()
+        s.track_offsets = self.track_offsets.copy()
+        s.vehicle_track = self.vehicle_track.copy()
+        s.vehicle_position = self.vehicle_position.copy()
+        s.series_on_track = self.series_on_track.copy()
+        s.used_tracks_count = self.used_tracks_count
+        s.unused_track_capacity = self.unused_track_capacity.copy()
+        s.goal_components = self.goal_components
+        s.used_tracks = None if self.used_tracks is None else self.used_tracks.copy()
+        s.feasible_moves = None
+        s.insertion_index = None if self.insertion_index is None else self.insertion_index.copy(s)
+        return s
+
+    def same_schedule(self, other):
+        return (np.array_equal(self.track_offsets, other.track_offsets) and
+                np.array_equal(self.track_vehicles, other.track_vehicles))
+
+    def track(self, track_index):
+        return self.track_vehicles[self.track_offsets[track_index]:self.track_offsets[track_index + 1]].tolist()
+
+    def track_size(self, track_index):
+        return int(self.track_offsets[track_index + 1] - self.track_offsets[track_index])
+
+    def track_sizes(self):
+        return np.diff(self.track_offsets).tolist()
+
+    def swap(self, track_1, index_1, track_2, index_2):
+        first = self.track_offsets[track_1] + index_1
+        second = self.track_offsets[track_2] + index_2
+        vehicle_1 = self.track_vehicles[first]
+        vehicle_2 = self.track_vehicles[second]
+        self.track_vehicles[first] = vehicle_2
+        self.track_vehicles[second] = vehicle_1
+        self.vehicle_track[vehicle_1] = track_2
+        self.vehicle_position[vehicle_1] = index_2
+        self.vehicle_track[vehicle_2] = track_1
+        self.vehicle_position[vehicle_2] = index_1
+        if self.track_count in (track_1, track_2):
+            self.__sort_unscheduled()
+
+    def relocate(self, track_from, index, track_to, position):
+        offsets = self.track_offsets
+        source = offsets[track_from] + index
+        vehicle = self.track_vehicles[source]
+        # destination index in buffer after vehicle is removed from its track
+        if track_to > track_from:
+            destination = offsets[track_to] - 1 + position
+        else:
+            destination = offsets[track_to] + position
+        if source < destination:
+            self.track_vehicles[source:destination] = self.track_vehicles[source + 1:destination + 1]
+        elif source > destination:
+            self.track_vehicles[destination + 1:source + 1] = self.track_vehicles[destination:source]
+        self.track_vehicles[destination] = vehicle
+        if track_from < track_to:
+            offsets[track_from + 1:track_to + 1] -= 1
+        elif track_to < track_from:
+            offsets[track_to + 1:track_from + 1] += 1
+        self.vehicle_track[vehicle] = track_to
+        self.__update_positions(track_from)
+        self.__update_positions(track_to)
+        if track_to == self.track_count:
+            self.__sort_unscheduled()
+
+    def __update_positions(self, track_index):
+        start = self.track_offsets[track_index]
+        end = self.track_offsets[track_index + 1]
+        self.vehicle_position[self.track_vehicles[start:end]] = np.arange(end - start)
+
+    def __sort_unscheduled(self):
+        self.track_vehicles[self.track_offsets[self.track_count]:].sort()
+        self.__update_positions(self.track_count)
@@ -1,19 +1,142 @@
 import argparse
+import csv
+import glob
 import os
+import tempfile
 import time
-from heuristic import Solver
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from decomposition import decomposed_search
+from engines import ENGINES, TabooEngine
+from heuristic import Solver, remove_vehicles
+from parallel import multi_start_search
+from telemetry import JsonLinesSink, Telemetry
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='Optimization of public transport garage schedule.')
-    parser.add_argument('inputfile', metavar='input_file',
-                        help='Name of input file stored in data/ folder')
+    parser.add_argument('inputfiles', metavar='input_file', nargs='+',
+                        help='Path of input file, or name of input file stored in data/ folder. Folders and glob '
+                             'patterns select all .txt files in them, more than one file is solved in batch mode')
+    parser.add_argument('--backend', choices=['list', 'array'], default='list',
+                        help='Solution representation used by search')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes that generate and score neighbourhoods')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of random number generator, makes search reproducible')
+    parser.add_argument('--runs', type=int, default=1,
+                        help='Number of independent taboo searches run in parallel, best one is kept')
+    parser.add_argument('--perturbation', type=float, default=0.0,
+                        help='Probability of random track choice in initial solution of each run')
+    parser.add_argument('--beam-width', type=int, default=1,
+                        help='Number of partial solutions kept by beam search construction of initial solution, 1 for greedy')
+    parser.add_argument('--warm-start', default=None,
+                        help='Result file (output/res-*.txt) of earlier run used as initial solution after repair')
+    parser.add_argument('--removed-vehicles', default='',
+                        help='Comma separated numbers of vehicles removed from instance since warm start result, '
+                             'numbered as in that result')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='taboo',
+                        help='Search engine, taboo search scores whole neighbourhood every iteration, '
+                             'late-acceptance and annealing score one move per iteration')
+    parser.add_argument('--time-limit', type=parse_duration, default=None,
+                        help='Search until this much time passes, e.g. 90s, 5m or 1h, in batch mode for every instance')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='Number of search iterations, if no time limit is given default is 300 for taboo '
+                             'search and 30000 for other engines')
+    parser.add_argument('--checkpoints', default='1m,5m',
+                        help='Comma separated times at which best solution so far is written to output folder')
+    parser.add_argument('--telemetry', default=None,
+                        help='Append search counters, timers and best fitness trace to this JSON lines file')
+    parser.add_argument('--clusters', type=int, default=1,
+                        help='Split tracks into this many clusters of weakly coupled tracks, solve them in parallel '
+                             '(on --workers processes) and finish with short search of whole instance')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of instances solved at once in batch mode, default is number of CPUs')
+    parser.add_argument('--summary', default='output/summary.csv',
+                        help='CSV file with summary table of batch mode')
     args = parser.parse_args()
 
-    instance = args.inputfile[8]
-    instance_data = load_instance(args.inputfile)
-    solver = Solver(*instance_data)
+    input_files = expand_input_files(args.inputfiles)
+    if not input_files:
+        parser.error('no input files found')
+    if args.runs > 1 and args.clusters > 1:
+        parser.error('--runs and --clusters can not be used together')
+    if len(input_files) > 1:
+        if args.runs > 1 or args.workers or args.telemetry or args.warm_start or args.clusters > 1:
+            parser.error('--runs, --workers, --telemetry, --warm-start and --clusters can not be used in batch mode, '
+                         'use --jobs')
+        # instance identifier names result files and summary rows, so it has to be unique in batch
+        files_by_id = {}
+        for input_file in input_files:
+            files_by_id.setdefault(instance_id(input_file), []).append(input_file)
+        duplicates = ['{} ({})'.format(instance, ', '.join(files)) for instance, files in files_by_id.items()
+                      if len(files) > 1]
+        if duplicates:
+            parser.error('input files with the same instance identifier would overwrite each other\'s results: ' +
+                         '; '.join(duplicates))
+        solve_batch(input_files, args)
+    else:
+        solve(input_files[0], args)
+
+
+def expand_input_files(inputs):
+    """Returns instance files given by paths, folders and glob patterns, in given order without duplicates."""
+    input_files = []
+    for value in inputs:
+        if os.path.isdir(value):
+            matches = sorted(glob.glob(os.path.join(value, '*.txt')))
+        elif glob.has_magic(value):
+            matches = sorted(glob.glob(value))
+        else:
+            matches = [value]
+        input_files.extend(match for match in matches if match not in input_files)
+    return input_files
+
+
+def instance_id(file_path):
+    """Returns instance identifier used in names of result files, e.g. 1 for data/instanca1.txt."""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if name.startswith('instanca') and len(name) > len('instanca'):
+        return name[len('instanca'):]
+    return name
+
+
+def make_engine(args):
+    if args.engine == 'taboo':
+        return TabooEngine(50, 100, 50, workers=args.workers)
+    return ENGINES[args.engine]()
+
+
+def search_limits(args, engine):
+    """Returns (iterations, checkpoints) of search, checkpoints map seconds to labels used in result file names."""
+    iterations = args.iterations
+    if iterations is None and args.time_limit is None:
+        iterations = engine.default_iterations
+    checkpoints = {parse_duration(label): label for label in args.checkpoints.split(',') if label}
+    return iterations, checkpoints
+
+
+def solve(input_file, args):
+    engine = make_engine(args)
+    iterations, checkpoints = search_limits(args, engine)
+
+    instance = instance_id(input_file)
+    instance_data = load_instance(input_file)
+    telemetry = Telemetry(JsonLinesSink(args.telemetry)) if args.telemetry else None
+    solver = Solver(*instance_data, backend=args.backend, seed=args.seed, telemetry=telemetry)
+    if args.warm_start:
+        schedule = read_result(args.warm_start)
+        if args.removed_vehicles:
+            schedule = remove_vehicles(schedule, [int(v) - 1 for v in args.removed_vehicles.split(',')])
+        repair_start = time.time()
+        solver.initial_solution = solver.repair_solution(schedule)
+        print('Warm start repaired in {:.3f}s'.format(time.time() - repair_start))
+    elif args.beam_width > 1:
+        solver.initial_solution = solver.generate_initial_solution(beam_width=args.beam_width)
 
     print('Initial solution')
     print('First global goal:', solver.global_goal_first(solver.initial_solution))
@@ -30,8 +153,39 @@ def main():
     # neighbourhood = solver.generate_neighbourhood(solver.initial_solution, 1)
     # print_neighbourhood(neighbourhood)
     start = time.time()
-    taboo_best_solution = solver.taboo_search(50, 300, 100, 50)
+    if args.clusters > 1:
+        # cluster searches run in worker processes, workers are used for clusters instead of neighbourhoods
+        cluster_engine = TabooEngine(50, 100, 50) if args.engine == 'taboo' else engine
+        taboo_best_solution, cluster_statistics = decomposed_search(
+            solver, args.clusters, engine=cluster_engine, iterations=iterations, time_limit=args.time_limit,
+            workers=args.workers, seed=args.seed, checkpoints=checkpoints,
+            on_checkpoint=lambda seconds, solution: write_result(str(solution), checkpoints[seconds], instance))
+        print()
+        print('Clusters')
+        for i, statistics in enumerate(cluster_statistics['clusters']):
+            print('Cluster {}: {tracks} tracks, {vehicles} vehicles, unscheduled {unscheduled}'.format(i, **statistics))
+        print('Merged fitness:', cluster_statistics['merged_fitness'])
+    elif args.runs > 1:
+        taboo_best_solution, run_statistics = multi_start_search(
+            solver, args.runs, args.seed, 50, iterations, 100, 50,
+            workers=args.workers, perturbation=args.perturbation, beam_width=args.beam_width,
+            time_limit=args.time_limit, engine=None if args.engine == 'taboo' else engine,
+            initial_solution=solver.initial_solution if args.warm_start else None, checkpoints=checkpoints,
+            on_checkpoint=lambda seconds, solution: write_result(str(solution), checkpoints[seconds], instance))
+        print()
+        print('Multi-start runs')
+        for statistics in run_statistics:
+            print('Run {run}: seed {seed}, initial fitness {initial_fitness}, fitness {fitness}, '
+                  'unscheduled {unscheduled_vehicles}, valid {valid}, time {runtime:.2f}s'.format(**statistics))
+    else:
+        def write_checkpoint(seconds, solution):
+            write_result(str(solution), checkpoints[seconds], instance)
+
+        taboo_best_solution = engine.run(solver, iterations, time_limit=args.time_limit, checkpoints=checkpoints,
+                                         on_checkpoint=write_checkpoint)
     end = time.time()
+    if telemetry is not None:
+        telemetry.close()
     print()
     print('Taboo solution')
     print('Code execution: ', end - start)
@@ -42,7 +196,96 @@ def main():
     print('Taboo fitness function:', solver.fitness_func(taboo_best_solution))
     print(taboo_best_solution)
     
-    write_result(str(taboo_best_solution), '1m', instance)
+    # result without time limit
+    write_result(str(taboo_best_solution), 'n', instance)
+
+
+def solve_instance(input_file, args):
+    """Solves one instance of batch and returns its row of summary table, runs in worker process."""
+    start = time.time()
+    engine = make_engine(args)
+    iterations, checkpoints = search_limits(args, engine)
+    instance = instance_id(input_file)
+    solver = Solver(*load_instance(input_file), backend=args.backend, seed=args.seed)
+    if args.beam_width > 1:
+        solver.initial_solution = solver.generate_initial_solution(beam_width=args.beam_width)
+    write_result(str(solver.initial_solution), 'initial', instance)
+
+    def write_checkpoint(seconds, solution):
+        write_result(str(solution), checkpoints[seconds], instance)
+
+    solution = engine.run(solver, iterations, time_limit=args.time_limit, checkpoints=checkpoints,
+                          on_checkpoint=write_checkpoint)
+    write_result(str(solution), 'n', instance)
+    return {
+        'instance': instance,
+        'file': input_file,
+        'fitness': float(solver.fitness_func(solution)),
+        'first_goal': float(solver.global_goal_first(solution)),
+        'second_goal': float(solver.global_goal_second(solution)),
+        'unscheduled': len(solution.unscheduled_vehicles),
+        'valid': solver.is_valid(solution)[0],
+        'runtime': time.time() - start,
+        'error': '',
+    }
+
+
+# columns of batch summary table: (key, title, width, value format)
+SUMMARY_COLUMNS = [
+    ('instance', 'Instance', 12, '{}'),
+    ('fitness', 'Fitness', 10, '{:.4f}'),
+    ('first_goal', 'First goal', 12, '{:.4f}'),
+    ('second_goal', 'Second goal', 13, '{:.4f}'),
+    ('unscheduled', 'Unscheduled', 13, '{}'),
+    ('valid', 'Valid', 7, '{}'),
+    ('runtime', 'Runtime', 9, '{:.2f}'),
+]
+
+
+def summary_line(cells):
+    # first column is aligned left, others right
+    return ''.join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                   for i, (cell, (_, _, width, _)) in enumerate(zip(cells, SUMMARY_COLUMNS)))
+
+
+def solve_batch(input_files, args):
+    """Solves instances concurrently in process pool, prints every result as it finishes and writes summary table."""
+    print(summary_line([title for _, title, _, _ in SUMMARY_COLUMNS]))
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(solve_instance, input_file, args): input_file for input_file in input_files}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                print('{:<12}failed: {}'.format(instance_id(input_file), e))
+                row = {'instance': instance_id(input_file), 'file': input_file, 'error': str(e)}
+            else:
+                print(summary_line([value_format.format(row[key]) for key, _, _, value_format in SUMMARY_COLUMNS]))
+            rows.append(row)
+
+    # summary in order of input files
+    order = {input_file: i for i, input_file in enumerate(input_files)}
+    rows.sort(key=lambda row: order[row['file']])
+    directory_name = os.path.dirname(args.summary)
+    if directory_name and not os.path.isdir(directory_name):
+        os.makedirs(directory_name)
+    with open(args.summary, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[key for key, _, _, _ in SUMMARY_COLUMNS] + ['file', 'error'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print('Summary written to', args.summary)
+
+
+def parse_duration(value):
+    """Returns number of seconds in duration like 45, 30s, 5m or 1h."""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
 
 def print_neighbourhood(neighbourhood):
     i = 0
@@ -52,56 +295,104 @@ def print_neighbourhood(neighbourhood):
         print(solution)
         i+=1
 
-def load_instance(filename):
-    file_path = 'data/{}'.format(filename)
-    with open(file_path, 'r') as f:
-        try:
-            vehicle_count = int(f.readline())
-            track_count = int(f.readline())
-            f.readline()
 
-            vehicle_lengths = [int(x) for x in f.readline().strip().split(' ')]
-            f.readline()
+# version of binary instance cache format, caches with other version are ignored
+INSTANCE_CACHE_VERSION = 1
+
 
-            vehicle_series = [int(x) for x in f.readline().strip().split(' ')]
-            f.readline()
+def load_instance(filename, use_cache=True):
+    """Loads instance from text file into NumPy arrays.
 
-            vehicle_restrictions = []
-            for _ in range(vehicle_count):
-                vehicle_restriction = [True if x == '1' else False
-                                       for x in f.readline().strip().split(' ')]
-                vehicle_restrictions.append(vehicle_restriction)
-            f.readline()
+    `filename` is path of instance file, or name of file stored in data/ folder. Parsed instance is
+    cached in binary file next to source (`<filename>.npz`) and loaded from there while source
+    does not change."""
+    file_path = filename
+    if not os.path.isfile(file_path):
+        file_path = os.path.join('data', filename)
+    cache_path = file_path + '.npz'
+    source_stat = os.stat(file_path)
+    source_key = np.array([INSTANCE_CACHE_VERSION, source_stat.st_size, source_stat.st_mtime_ns], dtype=np.int64)
+
+    if use_cache and os.path.isfile(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                if np.array_equal(cache['source_key'], source_key):
+                    return _instance_from_arrays(cache)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # damaged cache is parsed again and replaced
+            pass
 
-            track_lengths = [int(x) for x in f.readline().strip().split(' ')]
-            f.readline()
+    arrays = _parse_instance(file_path)
+    if use_cache:
+        # cache is written to temporary file and moved into place, so concurrent readers never see it half written
+        try:
+            f = tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path) or '.', suffix='.tmp', delete=False)
+        except OSError:
+            # cache is optional, e.g. data folder can be read only
+            pass
+        else:
+            try:
+                with f:
+                    np.savez(f, source_key=source_key, **arrays)
+                os.replace(f.name, cache_path)
+            except OSError:
+                os.unlink(f.name)
+    return _instance_from_arrays(arrays)
+
+
+def _parse_instance(file_path):
+    with open(file_path, 'r') as f:
+        lines = [line for line in (line.strip() for line in f) if line]
+    try:
+        vehicle_count = int(lines[0])
+        track_count = int(lines[1])
+        restriction_lines = lines[4:4 + vehicle_count]
+        if len(restriction_lines) != vehicle_count:
+            raise ValueError
+        vehicle_restrictions = np.array(' '.join(restriction_lines).split(), dtype=np.uint8)
+        vehicle_restrictions = vehicle_restrictions.reshape(vehicle_count, track_count).astype(bool)
+        blocking_pairs = [(int(record[0]), int(blocked))
+                          for record in (line.split() for line in lines[7 + vehicle_count:])
+                          for blocked in record[1:]]
+        return {
+            'counts': np.array([vehicle_count, track_count], dtype=np.int64),
+            'vehicle_lengths': np.array(lines[2].split(), dtype=np.int64),
+            'vehicle_series': np.array(lines[3].split(), dtype=np.int64),
+            # restriction matrix is stored packed, 8 tracks per byte
+            'vehicle_restrictions': np.packbits(vehicle_restrictions, axis=1),
+            'track_lengths': np.array(lines[4 + vehicle_count].split(), dtype=np.int64),
+            'departure_times': np.array(lines[5 + vehicle_count].split(), dtype=np.int64),
+            'schedule_type': np.array(lines[6 + vehicle_count].split(), dtype=np.int64),
+            'blocking_pairs': np.array(blocking_pairs, dtype=np.int64).reshape(-1, 2),
+        }
+    except (ValueError, IndexError):
+        raise Exception('Instance input file is incorrectly formatted!')
 
-            departure_times = [int(x) for x in f.readline().strip().split(' ')]
-            f.readline()
 
-            schedule_type = [int(x) for x in f.readline().strip().split(' ')]
-            f.readline()
+def _instance_from_arrays(arrays):
+    vehicle_count, track_count = arrays['counts'].tolist()
+    vehicle_restrictions = np.unpackbits(arrays['vehicle_restrictions'], axis=1, count=track_count).astype(bool)
+    blocking_tracks = {}
+    for blocking, blocked in arrays['blocking_pairs'].tolist():
+        blocking_tracks.setdefault(blocking, []).append(blocked)
+    return (
+        vehicle_count, track_count, arrays['vehicle_lengths'], arrays['vehicle_series'], vehicle_restrictions,
+        arrays['track_lengths'], arrays['departure_times'], arrays['schedule_type'], blocking_tracks
+    )
 
-            blocking_tracks = {}
-            for line in f.readlines():
-                blocking_record = [int(x) for x in line.strip().split(' ')]
-                blocking_tracks[blocking_record[0]] = blocking_record[1:]
 
-            return (
-                vehicle_count, track_count, vehicle_lengths, vehicle_series, vehicle_restrictions,
-                track_lengths, departure_times, schedule_type, blocking_tracks
-            )
-        except ValueError:
-            raise Exception('Instance input file is incorrectly formatted!')
+def read_result(file_path):
+    """Returns schedule from result file written by write_result, as list of tracks with vehicles numbered from 0."""
+    with open(file_path) as f:
+        return [[int(v) - 1 for v in line.split()] for line in f.read().split('\n')]
 
 
 def write_result(result_string, time, instance):
     filename = 'res-{}-i{}.txt'.format(time, instance)
     file_path = 'output/{}'.format(filename)
 
-    directory_name = os.path.join(os.getcwd(), 'output')
-    if not os.path.isdir(directory_name):
-        os.mkdir(directory_name)
+    # batch workers may create folder at the same time
+    os.makedirs(os.path.join(os.getcwd(), 'output'), exist_ok=True)
 
     with open(file_path, 'w+') as f:
         f.write(result_string)
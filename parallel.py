@@ -0,0 +1,273 @@
+import itertools
+import multiprocessing
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engines import TabooEngine
+from heuristic import Solver
+from telemetry import Telemetry
+
+
+class SharedInstance:
+    """Read-only instance arrays published once through shared memory.
+
+    Worker processes attach to the blocks by name and wrap them in NumPy arrays
+    without copying them."""
+
+    def __init__(self, solver):
+        blocking_pairs = [(blocking, blocked)
+                          for blocking, blocked_tracks in solver.blocking_tracks.items()
+                          for blocked in blocked_tracks]
+        arrays = {
+            'vehicle_lengths': np.asarray(solver.vehicle_lengths, dtype=np.int64),
+            'vehicle_series': np.asarray(solver.vehicle_series, dtype=np.int64),
+            'vehicle_restrictions': np.asarray(solver.vehicle_restrictions, dtype=np.bool_),
+            'track_lengths': np.asarray(solver.track_lengths, dtype=np.int64),
+            'departure_times': np.asarray(solver.departure_times, dtype=np.int64),
+            'schedule_type': np.asarray(solver.schedule_type, dtype=np.int64),
+            'blocking_pairs': np.asarray(blocking_pairs, dtype=np.int64).reshape(-1, 2),
+        }
+        self.blocks = []
+        # name -> (shared memory block name, shape, dtype) used by workers to attach
+        self.descriptor = {'vehicle_count': solver.vehicle_count, 'track_count': solver.track_count,
+                           'backend': solver.backend}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.descriptor[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_instance(descriptor):
+    """Returns (blocks, Solver) built on shared instance arrays, blocks must stay referenced."""
+    blocks = []
+    arrays = {}
+    for name, value in descriptor.items():
+        if not isinstance(value, tuple):
+            continue
+        block_name, shape, dtype = value
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+    blocking_tracks = {}
+    for blocking, blocked in arrays['blocking_pairs'].tolist():
+        blocking_tracks.setdefault(blocking, []).append(blocked)
+
+    solver = Solver(descriptor['vehicle_count'], descriptor['track_count'],
+                    arrays['vehicle_lengths'], arrays['vehicle_series'], arrays['vehicle_restrictions'],
+                    arrays['track_lengths'], arrays['departure_times'], arrays['schedule_type'],
+                    blocking_tracks, backend=descriptor['backend'], build_initial_solution=False)
+    return blocks, solver
+
+
+# state of worker process, set by _init_worker
+_worker_blocks = None
+_worker_solver = None
+
+
+def _init_worker(descriptor):
+    global _worker_blocks, _worker_solver
+    _worker_blocks, _worker_solver = attach_instance(descriptor)
+
+
+def _score_slice(solution, slice_index, slice_count, neighbourhood_length, seed, keep, taboo_attributes,
+                 collect_telemetry):
+    # generate and score one slice of neighbourhood, return `keep` best candidates that are not taboo
+    # and telemetry summary of the slice (None unless collect_telemetry is set)
+    solver = _worker_solver
+    solver.random.seed(seed)
+    telemetry = solver.telemetry = Telemetry() if collect_telemetry else None
+    moves = set()
+    if telemetry is not None:
+        with telemetry.timer('generation'):
+            moves.update(itertools.islice(solver.generate_unscheduled_moves(solution), slice_index, None, slice_count))
+            moves.update(solver.generate_random_moves(solution, neighbourhood_length, moves))
+        with telemetry.timer('scoring'):
+            scored = list(solver.score_moves(solution, moves))
+        telemetry.count('fitness_evaluations', len(scored))
+    else:
+        moves.update(itertools.islice(solver.generate_unscheduled_moves(solution), slice_index, None, slice_count))
+        moves.update(solver.generate_random_moves(solution, neighbourhood_length, moves))
+        scored = solver.score_moves(solution, moves)
+    scored = sorted(scored, key=lambda candidate: candidate[0], reverse=True)
+    candidates = []
+    for candidate in scored:
+        if len(candidates) == keep:
+            break
+        if not any((vehicle, track_to) in taboo_attributes
+                   for vehicle, _, track_to in solver.move_attributes(solution, candidate[1])):
+            candidates.append(candidate)
+    return candidates, telemetry.summary() if telemetry is not None else None
+
+
+class ParallelEvaluator:
+    """Process pool that generates and scores neighbourhoods of solver's solutions.
+
+    Every worker gets a share of the neighbourhood and returns only its `keep` best
+    candidates that are not taboo as (fitness, move, components) tuples. When solver collects
+    telemetry, counters and timers of workers are added to it, timers sum time of all workers."""
+
+    def __init__(self, solver, workers, keep=5):
+        self.solver = solver
+        self.workers = workers
+        self.keep = keep
+        self.shared_instance = SharedInstance(solver)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(self.shared_instance.descriptor,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.shared_instance.close()
+
+    def score_neighbourhood(self, solution, neighbourhood_length, taboo_list=None):
+        share = -(-neighbourhood_length // self.workers)
+        # workers skip taboo moves, so that they do not crowd out the best move search can take
+        taboo_attributes = set(taboo_list.attribute_counts) if taboo_list is not None else set()
+        futures = [self.executor.submit(_score_slice, solution, index, self.workers, share,
+                                        self.solver.random.getrandbits(32), self.keep, taboo_attributes,
+                                        self.solver.telemetry is not None)
+                   for index in range(self.workers)]
+        candidates = []
+        for future in futures:
+            slice_candidates, summary = future.result()
+            candidates.extend(slice_candidates)
+            if summary is not None:
+                self.solver.telemetry.merge(summary)
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates
+
+
+def _run_search(run_index, seed, perturbation, beam_width, initial_solution, engine, iterations, deadline,
+                search_start, checkpoints, reports):
+    # one independent taboo search run in worker process, stops at absolute `deadline` shared by all runs,
+    # best solution at each of `checkpoints` seconds since `search_start` is put into `reports` queue
+    solver = _worker_solver
+    start = time.time()
+    solver.random.seed(seed)
+    if initial_solution is None:
+        initial_solution = solver.generate_initial_solution(perturbation, beam_width)
+    solver.initial_solution = solver.to_backend(initial_solution)
+    initial_fitness = solver.fitness_func(solver.initial_solution)
+
+    offset = time.time() - search_start
+    # run checkpoints are measured from its own start, checkpoints that passed before it are skipped
+    run_checkpoints = {seconds - offset: seconds for seconds in checkpoints if seconds > offset}
+    if reports is not None:
+        reports.put(('start', run_index, offset))
+
+    def report_checkpoint(seconds, solution):
+        reports.put(('checkpoint', run_index, run_checkpoints[seconds], float(solver.fitness_func(solution)), solution))
+
+    time_limit = None if deadline is None else max(0.0, deadline - time.time())
+    solution = engine.run(solver, iterations, time_limit=time_limit, checkpoints=run_checkpoints,
+                          on_checkpoint=report_checkpoint if reports is not None else None)
+    statistics = {
+        'run': run_index,
+        'seed': seed,
+        'initial_fitness': float(initial_fitness),
+        'fitness': float(solver.fitness_func(solution)),
+        'unscheduled_vehicles': len(solution.unscheduled_vehicles),
+        'valid': solver.is_valid(solution)[0],
+        'runtime': time.time() - start,
+        'end': time.time() - search_start,
+    }
+    return solution, statistics
+
+
+def multi_start_search(solver, runs, seed, taboo_duration, iterations, neighbourhood_length, reset_iteration,
+                       workers=None, perturbation=0.0, beam_width=1, time_limit=None, engine=None,
+                       initial_solution=None, checkpoints=(), on_checkpoint=None):
+    """Runs `runs` independent taboo searches in process pool and returns (best solution, run statistics).
+
+    Every run has its own random number generator seeded from `seed`, so results are reproducible.
+    With `perturbation` > 0 every run starts from differently perturbed greedy solution.
+    With `beam_width` > 1 every run starts from beam search solution instead.
+    With `time_limit` all runs stop that many seconds after search starts, also runs that waited for a worker.
+    With `engine` (engines.Engine) set runs use it instead of taboo search with given arguments.
+    With `initial_solution` set every run starts from it instead of constructed solution.
+    `on_checkpoint(seconds, solution)` is called with the best solution of all runs once each of
+    `checkpoints` seconds passes, as in Solver.taboo_search."""
+    run_seeds = np.random.SeedSequence(seed).generate_state(runs).tolist()
+    if engine is None:
+        engine = TabooEngine(taboo_duration, neighbourhood_length, reset_iteration)
+    checkpoints = sorted(checkpoints) if on_checkpoint else []
+    start = time.time()
+    deadline = None if time_limit is None else start + time_limit
+    shared_instance = SharedInstance(solver)
+    manager = multiprocessing.Manager() if checkpoints else None
+    try:
+        reports = manager.Queue() if manager is not None else None
+        with ProcessPoolExecutor(max_workers=workers or runs, initializer=_init_worker,
+                                 initargs=(shared_instance.descriptor,)) as executor:
+            futures = {executor.submit(_run_search, index, run_seed, perturbation, beam_width, initial_solution,
+                                       engine, iterations, deadline, start, checkpoints, reports): index
+                       for index, run_seed in enumerate(run_seeds)}
+            results = _collect_runs(futures, start, checkpoints, on_checkpoint, reports)
+    finally:
+        if manager is not None:
+            manager.shutdown()
+        shared_instance.close()
+
+    # checkpoints not reached before all runs stopped get the final solution, as in Solver.taboo_search
+    best_solution, _ = max(results, key=lambda result: result[1]['fitness'])
+    for seconds in checkpoints:
+        if time_limit is None or seconds <= time_limit:
+            on_checkpoint(seconds, best_solution)
+    return best_solution, [statistics for _, statistics in sorted(results, key=lambda result: result[1]['run'])]
+
+
+def _collect_runs(futures, start, checkpoints, on_checkpoint, reports):
+    # waits for all runs and calls on_checkpoint for every checkpoint as soon as every run that was
+    # searching at that time reported it or finished; written checkpoints are removed from `checkpoints`
+    results = []
+    started = {}
+    # checkpoint -> {run: (fitness, solution)}
+    reported = {seconds: {} for seconds in checkpoints}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.1 if checkpoints else None, return_when=FIRST_COMPLETED)
+        results.extend(future.result() for future in done)
+        while reports is not None:
+            try:
+                report = reports.get_nowait()
+            except queue.Empty:
+                break
+            if report[0] == 'start':
+                started[report[1]] = report[2]
+            else:
+                _, run, seconds, fitness, solution = report
+                reported[seconds][run] = (fitness, solution)
+
+        elapsed = time.time() - start
+        while checkpoints and checkpoints[0] <= elapsed:
+            seconds = checkpoints[0]
+            finished = [(statistics['fitness'], solution) for solution, statistics in results
+                        if statistics['end'] <= seconds]
+            finished_runs = set(statistics['run'] for _, statistics in results)
+            waiting = [run for run, offset in started.items()
+                       if offset < seconds and run not in finished_runs] if pending else []
+            if any(run not in reported[seconds] for run in waiting):
+                break
+            candidates = list(reported[seconds].values()) + finished
+            if not candidates:
+                # no run got to search before this checkpoint, it is written with the final solution
+                break
+            on_checkpoint(checkpoints.pop(0), max(candidates, key=lambda candidate: candidate[0])[1])
+    return results
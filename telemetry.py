@@ -0,0 +1,104 @@
+import collections
+import contextlib
+import json
+import time
+
+# constraint broken by rejected move, recognized from violation message of Solver.is_valid_move
+VIOLATION_KINDS = (
+    ('departs later', 'departure_order'),
+    ('not same series', 'series'),
+    ('restricted', 'restriction'),
+    ('over its capacity', 'capacity'),
+    ('blocked track', 'blocking'),
+)
+
+
+def violation_kind(violation):
+    """Returns name of constraint described by violation message."""
+    for text, kind in VIOLATION_KINDS:
+        if text in violation:
+            return kind
+    return 'other'
+
+
+class MemorySink:
+    """Keeps telemetry records in `records` list."""
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """Appends every telemetry record as one JSON line to file."""
+    def __init__(self, file_path):
+        self.file = open(file_path, 'a', buffering=1)
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class Telemetry:
+    """Counters, timers and events of one solver, events are written to sink as they happen.
+
+    Solver collects telemetry only when its `telemetry` attribute is set, so search without
+    telemetry pays only for `is None` checks."""
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else MemorySink()
+        self.start = time.monotonic()
+        self.counters = collections.Counter()
+        # name -> [number of measured calls, seconds]
+        self.timers = collections.defaultdict(lambda: [0, 0.0])
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def add_time(self, name, seconds):
+        timer = self.timers[name]
+        timer[0] += 1
+        timer[1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def reject(self, violation):
+        """Counts move rejected by validation under the constraint it breaks."""
+        self.counters['rejected_moves'] += 1
+        self.counters['rejected_' + violation_kind(violation)] += 1
+
+    def record(self, event, **values):
+        """Writes event with seconds since telemetry was created to sink."""
+        values['event'] = event
+        values['time'] = time.monotonic() - self.start
+        self.sink.write(values)
+
+    def merge(self, summary):
+        """Adds counters and timers of summary returned by `summary` of another telemetry, e.g. of worker process."""
+        self.counters.update(summary['counters'])
+        for name, values in summary['timers'].items():
+            timer = self.timers[name]
+            timer[0] += values['calls']
+            timer[1] += values['seconds']
+
+    def summary(self):
+        return {'counters': dict(self.counters),
+                'timers': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in self.timers.items()}}
+
+    def record_summary(self):
+        self.record('summary', **self.summary())
+
+    def close(self):
+        self.sink.close()
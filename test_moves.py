@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from heuristic import Solver
+from main import load_instance
+
+INSTANCES = ['instanca1.txt', 'instanca2.txt', 'instanca3.txt']
+BACKENDS = ['list', 'array']
+STEPS = 300
+
+
+def random_move(solver, solution, rng):
+    """Returns random swap or relocation of solution, valid or not, half of them drawn by solver."""
+    if rng.random() < 0.5:
+        return solver.sample_move(solution, insertion_rate=0.3)
+    tracks = [t for t in range(solver.track_count + 1) if solution.track_size(t) > 0]
+    if rng.random() < 0.5:
+        t1, t2 = rng.choice(tracks), rng.choice(tracks)
+        if t1 == t2 == solver.track_count:
+            return None
+        return ('swap', t1, rng.randrange(solution.track_size(t1)), t2, rng.randrange(solution.track_size(t2)))
+    t_from, t_to = rng.choice(tracks), rng.randrange(solver.track_count + 1)
+    if t_from == t_to == solver.track_count:
+        return None
+    size = solution.track_size(t_to) - (1 if t_from == t_to else 0)
+    return ('relocate', t_from, rng.randrange(solution.track_size(t_from)), t_to, rng.randint(0, size))
+
+
+def random_walk(instance, backend):
+    """Yields (solver, solution, move, solution after move) for random moves along a walk of valid moves."""
+    solver = Solver(*load_instance(instance, use_cache=False), backend=backend, seed=1)
+    rng = random.Random(1)
+    solution = solver.initial_solution
+    for _ in range(STEPS):
+        move = random_move(solver, solution, rng)
+        if move is None:
+            continue
+        moved = solver.apply_move(solution.copy(), move)
+        yield solver, solution, move, moved
+        if solver.is_valid(moved)[0]:
+            solution = moved
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('instance', INSTANCES)
+def test_move_components(instance, backend):
+    for solver, solution, move, moved in random_walk(instance, backend):
+        if not solver.is_valid(moved)[0]:
+            continue
+        expected = solver.goal_components(moved)
+        assert solver.move_components(solution, move) == pytest.approx(expected), move
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('instance', INSTANCES)
+def test_is_valid_move(instance, backend):
+    for solver, solution, move, moved in random_walk(instance, backend):
+        assert solver.is_valid_move(solution, move)[0] == solver.is_valid(moved)[0], move
+
+
+@pytest.mark.parametrize('instance', INSTANCES)
+def test_batch_goals(instance):
+    # solutions of both backends are scored together
+    solutions = []
+    for backend in BACKENDS:
+        for solver, _, _, moved in random_walk(instance, backend):
+            if solver.is_valid(moved)[0]:
+                solutions.append(moved)
+    first_goal, second_goal = solver.batch_goals(solutions)
+    fitness = solver.batch_fitness(solutions)
+    for k, solution in enumerate(solutions):
+        assert first_goal[k] == solver.global_goal_first(solution)
+        assert second_goal[k] == solver.global_goal_second(solution)
+        assert fitness[k] == solver.fitness_func(solution)